@@ -1,4 +1,6 @@
+import numpy
 from .props import ImportColorSet
+from .functions.library_functions import geometry_hash, widget_to_arrays, faces_from_arrays
 
 
 class BoneWidgetImportData:
@@ -15,6 +17,9 @@ class BoneWidgetImportData:
         self.duplicate_imports: list[Widget | ColorSet] = []
         self.import_type: str | None = None  # Type of import operation (None if undefined)
         self.json_import_error: bool = False  # Flag for JSON parsing errors
+        self.thumbnail_dir: str | None = None  # validated thumbnails extracted during the import
+        self.change_report: dict | None = None  # classification of every widget of a merge
+        self.delta: dict | None = None  # delta manifest when importing a delta library
 
     def imported(self) -> int:
         """Returns the number of newly imported items or total imported items."""
@@ -40,35 +45,53 @@ class BoneWidgetImportData:
 
 
 class Widget:
-    def __init__(self, name: str, widget_dict: dict):
+    """
+    Library widget held as numpy arrays instead of nested lists.
+
+    Geometry that can't be converted (failed imports) is kept as it was given.
+    """
+    __slots__ = ("_name", "_vertices", "_edges", "_face_sizes", "_face_indices",
+                 "_faces", "_image", "_geometry_hash")
+
+    def __init__(self, name: str, widget_dict: dict, geometry_hash: str | None = None):
         self._name: str = name if name else "Unnamed Widget"
-        self._vertices: list[list[float]] = widget_dict.get("vertices", [[]])  # Ensure list structure
-        self._edges: list[list[int]] = widget_dict.get("edges", [[]])
-        self._faces: list[list[int]] = widget_dict.get("faces", [[]])
+        if not isinstance(widget_dict, dict):
+            widget_dict = {}
+        try:
+            self._vertices, self._edges, self._face_sizes, self._face_indices = widget_to_arrays(widget_dict)
+            self._faces = None  # built from the face arrays when asked for
+        except (ValueError, TypeError):
+            self._vertices = widget_dict.get("vertices", [[]])
+            self._edges = widget_dict.get("edges", [[]])
+            self._faces = widget_dict.get("faces", [[]])
+            self._face_sizes = self._face_indices = None
         self._image: str = widget_dict.get("image", "") or "user_defined.png"
+        self._geometry_hash: str | None = geometry_hash
 
     @property
     def name(self) -> str:
         """Returns the widget name."""
         return self._name
-    
+
     @name.setter
     def name(self, new_name: str) -> None:
         self._name = new_name
 
     @property
-    def vertices(self) -> list[list[float]]:
-        """Returns the list of vertices."""
+    def vertices(self) -> numpy.ndarray:
+        """Returns the (N, 3) vertex array."""
         return self._vertices
 
     @property
-    def edges(self) -> list[list[int]]:
-        """Returns the list of edges."""
+    def edges(self) -> numpy.ndarray:
+        """Returns the (N, 2) edge array."""
         return self._edges
 
     @property
     def faces(self) -> list[list[int]]:
         """Returns the list of faces."""
+        if self._faces is None:
+            return faces_from_arrays(self._face_sizes, self._face_indices)
         return self._faces
 
     @property
@@ -76,6 +99,17 @@ class Widget:
         """Returns the image filename."""
         return self._image
 
+    @property
+    def geometry_hash(self) -> str:
+        """Returns the content hash of the geometry (computed once)."""
+        if self._geometry_hash is None:
+            if self._faces is None:
+                geometry = (self._vertices, self._edges, self._face_sizes, self._face_indices)
+            else:
+                geometry = {"vertices": self._vertices, "edges": self._edges, "faces": self._faces}
+            self._geometry_hash = geometry_hash(geometry)
+        return self._geometry_hash
+
     def __repr__(self):
         return f"Widget({self.name})"
 
@@ -83,17 +117,19 @@ class Widget:
         if not isinstance(other, Widget):
             return False
         return (
-            self.vertices == other.vertices and
-            self.edges == other.edges and
-            self.faces == other.faces and
-            self.image == other.image
+            self.image == other.image and
+            self.geometry_hash == other.geometry_hash
         )
-    
+
+    def __hash__(self) -> int:
+        return hash((self.geometry_hash, self.image))
+
     def to_dict(self) -> dict[str, dict[str, list | str]]:
         """
         Returns a dictionary with the widget's name as the key,
         and its attributes as the value. Matches the structure of the
-        original widgets collection.
+        original widgets collection, vertices and edges are the widget's
+        own arrays (not copies).
         """
         return {
             self.name: {
@@ -106,36 +142,46 @@ class Widget:
 
 
 class ColorSet:
+    """Color preset with its normal, select and active colors in one numpy array."""
+    __slots__ = ("_name", "_colors", "_hash")
+
     def __init__(self, color_dict: dict[str, list[float]]):
+        if not isinstance(color_dict, dict):
+            color_dict = {}
         self._name: str = color_dict.get("name", "Unnamed ColorSet")
-        self._normal: list[float] = color_dict.get("normal", [])
-        self._select: list[float] = color_dict.get("select", [])
-        self._active: list[float] = color_dict.get("active", [])
+        try:
+            self._colors = numpy.array([color_dict.get(attr, []) for attr in ("normal", "select", "active")],
+                                       dtype=numpy.float64)
+            if self._colors.ndim != 2:
+                raise ValueError
+        except (ValueError, TypeError):
+            self._colors = numpy.empty((3, 0), dtype=numpy.float64)  # malformed preset
+        self._hash: int | None = None
 
     @property
     def name(self) -> str:
         """Returns the color set name."""
         return self._name
-    
+
     @name.setter
     def name(self, new_name: str) -> None:
         """Sets a new color set name."""
         self._name = new_name
 
     @property
-    def normal(self) -> list[float]:
+    def normal(self) -> numpy.ndarray:
         """Returns the normal color values."""
-        return self._normal
+        return self._colors[0]
 
     @property
-    def select(self) -> list[float]:
+    def select(self) -> numpy.ndarray:
         """Returns the select color values."""
-        return self._select
+        return self._colors[1]
 
     @property
-    def active(self) -> list[float]:
+    def active(self) -> numpy.ndarray:
         """Returns the active color values."""
-        return self._active
+        return self._colors[2]
 
     def __repr__(self) -> str:
         return f"ColorSet({self.name})"
@@ -143,12 +189,22 @@ class ColorSet:
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, ColorSet):
             return False
-        return (
-            self.normal == other.normal and
-            self.select == other.select and
-            self.active == other.active
-        )
-    
+        return numpy.array_equal(self._colors, other._colors)
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(self._colors.tobytes())
+        return self._hash
+
+    def to_dict(self) -> dict[str, list[float] | str]:
+        """Returns the color set in the json structure, the colors are views of its array."""
+        return {
+            "name": self.name,
+            "normal": self.normal,
+            "select": self.select,
+            "active": self.active
+        }
+
     @classmethod
     def from_pg(cls, pg: ImportColorSet) -> "ColorSet":
         """
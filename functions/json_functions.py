@@ -1,17 +1,110 @@
 import bpy
 import os
 import json
+import time
+import codecs
+import shutil
+import zlib
+import uuid
 import numpy
 import re
 from .main_functions import get_preferences
+from .library_functions import (
+    load_widget_file,
+    save_widget_file,
+    LazyWidgetData,
+    get_journal_path,
+    read_journal,
+    iter_journal_changes,
+    append_widget_records,
+    compact_widget_file,
+    classify_widget_change,
+    geometry_hash,
+    json_default,
+    GEOMETRY_HASH_VERSION,
+    MALFORMED_WIDGET_ERRORS,
+    CHANGES_TO_IMPORT,
+)
 from ..classes import BoneWidgetImportData, Widget, ColorSet
 from .. import __package__
 
 JSON_DEFAULT_WIDGETS = "widgets.json"
 JSON_USER_WIDGETS = "user_widgets.json"
 JSON_COLOR_PRESETS = "custom_color_sets.json"
+JSON_STREAM_CHUNK_SIZE = 64 * 1024  # bytes read at a time when importing a library
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+EXPORT_MANIFEST = "export_manifest.json"  # content hashes of the last export
+DELTA_MANIFEST = "delta.json"  # marks a delta library and lists the removed widgets
+DELTA_STATE = "library_delta_state.json"  # export id of the last delta applied
+LIBRARY_MERGE_REPORT = "library_merge_report.json"  # changes of the last merge, the base of the next one
+THUMBNAIL_IMPORT_WORKERS = min(8, os.cpu_count() or 1)  # threads reading thumbnails from a library
+
+# timings of the last widget library import, for profiling large archives
+library_import_stats = {
+    "widgets": 0,
+    "parse_time": 0.0,
+    "thumbnails": 0,
+    "invalid_thumbnails": 0,
+    "extract_time": 0.0,
+    "install_time": 0.0,
+}
+
+
+def format_library_import_stats():
+    """Returns the per-stage timings of the last widget library import as one line."""
+    stats = library_import_stats
+    return (f"{stats['widgets']} widgets parsed in {stats['parse_time']:.2f}s, "
+            f"{stats['thumbnails']} thumbnails extracted in {stats['extract_time']:.2f}s "
+            f"({stats['invalid_thumbnails']} damaged), installed in {stats['install_time']:.2f}s")
+
+widget_data = None  # LazyWidgetData over the default and user widget files
+
+
+class FileCache:
+    """
+    Keeps parsed file contents around until the file changes on disk.
+
+    Entries are keyed on the file path and validated against its mtime and size,
+    writers should call invalidate() as some file systems have a coarse mtime.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _file_key(filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None  # missing files are cached too
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, filepath, loader):
+        """Returns the cached data for filepath, or loader(filepath) if it changed."""
+        key = self._file_key(filepath)
+        entry = self._entries.get(filepath)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        data = loader(filepath)
+        self._entries[filepath] = (key, data)
+        return data
+
+    def invalidate(self, filepath=None):
+        if filepath is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(filepath, None)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
 
-widget_data = {}
+file_cache = FileCache()
 
 
 def get_addon_dir():
@@ -64,9 +157,9 @@ def validate_json_data(data: dict, required_keys: tuple, can_be_empty: bool = Tr
     return True
 
 
-def update_preview_collection():
-    from .functions.preview_functions import create_preview_collection
-    create_preview_collection()
+def update_preview_collection(updated=(), removed=()):
+    from .preview_functions import update_preview_items
+    update_preview_items(updated, removed)
 
 
 def objectDataToDico(object, custom_image):
@@ -94,8 +187,23 @@ def objectDataToDico(object, custom_image):
     return (wgts)
 
 
-def read_widgets(filename=""):
+def load_widget_data():
+    """Reloads the lazy widget data, only names and images are read up front."""
+    global widget_data
+    release_widget_data()
+    widget_data = LazyWidgetData([get_widget_directory(file) for file in
+                                  (JSON_DEFAULT_WIDGETS, JSON_USER_WIDGETS)])
+    return widget_data
+
+
+def release_widget_data():
     global widget_data
+    if widget_data is not None:
+        widget_data.close()
+        widget_data = None
+
+
+def read_widgets(filename=""):
     wgts = {}
 
     if not filename:
@@ -104,32 +212,92 @@ def read_widgets(filename=""):
         files = [filename]
 
     for file in files:
-        jsonFile = get_widget_directory(file)
-        if os.path.exists(jsonFile):
-            f = open(jsonFile, 'r')
-            wgts.update(json.load(f))
-            f.close()
+        base, changes = _read_widget_file(file)
+        # callers modify the returned widgets, so hand out copies
+        wgts.update({name: dict(data) for name, data in base.items()})
+        for name, data in changes:
+            if data is None:
+                wgts.pop(name, None)
+            else:
+                wgts[name] = dict(data)
 
     if not filename:  # if both files have been read
-        widget_data = wgts.copy()
+        load_widget_data()
 
     return (wgts)
 
 
+def _read_widget_file(file):
+    """Returns the cached contents of a widget file and the changes recorded in its journal."""
+    jsonFile = get_widget_directory(file)
+    # goes through the binary copy of the json file when it is up to date
+    base = file_cache.get(jsonFile, load_widget_file)
+    records = file_cache.get(get_journal_path(jsonFile), read_journal)
+    return base, list(iter_journal_changes(records))
+
+
+def read_widget_names(file):
+    base, changes = _read_widget_file(file)
+    names = set(base.keys())
+    for name, data in changes:
+        if data is None:
+            names.discard(name)
+        else:
+            names.add(name)
+    return names
+
+
+def ensure_widget_data():
+    """Returns the lazy widget data, reloading it only if it was released."""
+    if widget_data is None:
+        load_widget_data()
+    return widget_data
+
+
 def get_widget_data(widget):
-    return widget_data[widget]
+    return ensure_widget_data()[widget]
+
+
+def get_widget_arrays(widget):
+    """Returns the (vertices, edges, face_sizes, face_indices) arrays of a widget."""
+    return ensure_widget_data().widget_arrays(widget)
+
+
+def get_widget_geometry_hash(widget):
+    """Returns the geometry hash of a library widget, stored in the binary library."""
+    return ensure_widget_data().geometry_hash(widget)
 
 
 def write_widgets(wgts, file):
     jsonFile = get_widget_directory(file)
-    # if os.path.exists(jsonFile):
-    f = open(jsonFile, 'w')
-    f.write(json.dumps(wgts))
-    f.close()
+    # unmap the binary files first so they can be replaced (required on Windows)
+    release_widget_data()
+    save_widget_file(wgts, jsonFile)
+    file_cache.invalidate(jsonFile)
+    file_cache.invalidate(get_journal_path(jsonFile))
+
+
+def write_widget_changes(updated, removed, file):
+    """Writes only the given widgets, appending them to the journal of the widget file."""
+    jsonFile = get_widget_directory(file)
+    release_widget_data()
+    if append_widget_records(jsonFile, updated, removed):
+        file_cache.invalidate(jsonFile)  # the journal got compacted into the json file
+    file_cache.invalidate(get_journal_path(jsonFile))
+
+
+def compact_widgets(file):
+    """Makes sure the json file holds all widgets, e.g. before it is copied elsewhere."""
+    jsonFile = get_widget_directory(file)
+    release_widget_data()
+    compact_widget_file(jsonFile)
+    file_cache.invalidate(jsonFile)
+    file_cache.invalidate(get_journal_path(jsonFile))
 
 
 def add_remove_widgets(context, addOrRemove, items, widgets, widget_name="", custom_image=""):
     wgts = {}
+    removed = []
 
     # file from where the widget should be read or written to
     file = JSON_USER_WIDGETS
@@ -142,7 +310,6 @@ def add_remove_widgets(context, addOrRemove, items, widgets, widget_name="", cus
     ob_name = None
     return_message = ""
     if addOrRemove == 'add':
-        wgts = read_widgets(file)
         bw_widget_prefix = get_preferences(context).widget_prefix
         for ob in widgets:
             if not widget_name:
@@ -160,14 +327,12 @@ def add_remove_widgets(context, addOrRemove, items, widgets, widget_name="", cus
                 return_message = "Widget - " + ob_name + " has been added!"
 
     elif addOrRemove == 'remove':
-        user_widgets = read_widgets(file)
-        if widgets in user_widgets:
-            wgts = user_widgets
+        if widgets in read_widget_names(file):
+            removed.append(widgets)
         else:
             file = JSON_DEFAULT_WIDGETS
             wgts = read_widgets(file)
-
-        del wgts[widgets]
+            del wgts[widgets]
         if widgets in widget_items:
             widget_index = widget_items.index(widgets)
             activeShape = widget_items[widget_index +
@@ -177,10 +342,17 @@ def add_remove_widgets(context, addOrRemove, items, widgets, widget_name="", cus
 
     if activeShape is not None:
 
-        write_widgets(wgts, file)
+        if file == JSON_USER_WIDGETS:
+            # only write what changed
+            write_widget_changes(wgts, removed, file)
+        else:
+            write_widgets(wgts, file)
 
         # update the preview panel
-        update_preview_collection()
+        if addOrRemove == 'add':
+            update_preview_collection(updated=wgts.keys())
+        else:
+            update_preview_collection(removed=[widgets])
 
         # trigger an update and display widget
         bpy.context.window_manager.widget_list = activeShape
@@ -190,13 +362,36 @@ def add_remove_widgets(context, addOrRemove, items, widgets, widget_name="", cus
         return 'WARNING', "Widget - " + ob_name + " already exists!"
 
 
-def export_widget_library(filepath):
+def export_widget_library(filepath, delta=False):
+    """
+    Zips the user widgets and the custom thumbnails they use, returns the number of
+    widgets written and the number of removed widgets listed in a delta.
+
+    A delta export only writes the widgets that are new or changed since the last
+    export, plus the names of removed ones, based on the export manifest.
+    """
+    # the exported json file has to include the journaled changes
+    compact_widgets(JSON_USER_WIDGETS)
     wgts = read_widgets(JSON_USER_WIDGETS)
 
-    if wgts:
+    previous = read_export_manifest()
+    if delta and previous is None:
+        print("No previous export to compare against, exporting the whole library")
+        delta = False
+    previous_widgets = previous["widgets"] if previous else {}
+
+    versions = get_widget_versions(wgts, previous_widgets)
+    if delta:
+        exported = {name: data for name, data in wgts.items()
+                    if not same_widget_version(versions[name], previous_widgets.get(name))}
+        removed = sorted(set(previous_widgets) - set(wgts))
+    else:
+        exported = wgts
+        removed = []
+
+    if exported or removed:
         # variables needed for exporting widgets
         dest_dir = os.path.dirname(filepath)
-        json_dir = get_custom_dir()
         image_folder = 'custom_thumbnails'
         custom_image_dir = get_custom_image_dir(image_folder)
 
@@ -206,32 +401,197 @@ def export_widget_library(filepath):
         elif not filename.endswith('.zip'):
             filename += ".zip"
 
+        export_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
         # start the zipping process
         try:
             from zipfile import ZipFile
             with ZipFile(os.path.join(dest_dir, filename), "w") as zip:
-                # write the json file
-                file = os.path.join(json_dir, JSON_USER_WIDGETS)
-                arcname = os.path.basename(file)
-                zip.write(file, arcname=arcname)
-
-                # write the custom images if present
-                if os.path.exists(custom_image_dir):
-                    from pathlib import Path
-                    for filepath in Path(custom_image_dir).iterdir():
-                        arcname = os.path.join(
-                            image_folder, os.path.basename(filepath))
-                        zip.write(filepath, arcname=arcname)
+                # write the json file first, importers read the first json member
+                if delta:
+                    zip.writestr(JSON_USER_WIDGETS, json.dumps(exported, default=json_default))
+                    zip.writestr(DELTA_MANIFEST, json.dumps({
+                        "version": 1,
+                        "export_id": export_id,
+                        "base": previous.get("export_id"),
+                        "removed": removed,
+                    }))
+                else:
+                    zip.write(get_widget_directory(JSON_USER_WIDGETS), arcname=JSON_USER_WIDGETS)
+
+                # write only the custom images the exported widgets use
+                for image in sorted({data.get("image") for data in exported.values()}):
+                    if not image:
+                        continue
+                    image_path = os.path.join(custom_image_dir, image)
+                    if os.path.isfile(image_path):
+                        zip.write(image_path, arcname=f"{image_folder}/{image}")
         except Exception as e:
             print("Error exporting widget library: ", e)
-            return 0
+            return 0, 0
+
+        write_export_manifest(export_id, versions)
+
+    return len(exported), len(removed)
+
 
-    return len(wgts)
+def get_widget_versions(wgts, previous_widgets):
+    """
+    Returns {name: version} for the manifest, the image crc is only recomputed
+    when the file's size or modification time changed since the last export.
+    """
+    library = ensure_widget_data()
+    custom_image_dir = get_custom_image_dir('custom_thumbnails')
+    versions = {}
+    for name, data in wgts.items():
+        image = data.get("image", "")
+        try:
+            stat = os.stat(os.path.join(custom_image_dir, image)) if image else None
+        except OSError:
+            stat = None
+
+        previous = previous_widgets.get(name) or {}
+        if stat is None:
+            image_crc = None
+        elif (previous.get("image") == image and previous.get("image_size") == stat.st_size
+              and previous.get("image_mtime") == stat.st_mtime_ns):
+            image_crc = previous.get("image_crc")
+        else:
+            image_crc = get_image_crc(image)
+
+        versions[name] = {
+            # the binary library stores the hashes, the journal was compacted above
+            "geometry_hash": library.geometry_hash(name) if name in library else geometry_hash(data),
+            "image": image,
+            "image_crc": image_crc,
+            "image_size": stat.st_size if stat else None,
+            "image_mtime": stat.st_mtime_ns if stat else None,
+        }
+    return versions
+
+
+def same_widget_version(version, previous):
+    if previous is None:
+        return False
+    return all(version[key] == previous.get(key) for key in ("geometry_hash", "image", "image_crc"))
+
+
+def read_export_manifest():
+    """Returns the manifest of the last export, None if there wasn't one."""
+    try:
+        with open(os.path.join(get_custom_dir(), EXPORT_MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("widgets"), dict):
+        return None
+    if manifest.get("hash_version") != GEOMETRY_HASH_VERSION:
+        return None  # hashed differently, it can't be compared against
+    return manifest
+
+
+def write_export_manifest(export_id, versions):
+    try:
+        with open(os.path.join(get_custom_dir(), EXPORT_MANIFEST), "w") as f:
+            json.dump({"version": 1, "hash_version": GEOMETRY_HASH_VERSION,
+                       "export_id": export_id, "widgets": versions}, f)
+    except OSError as e:
+        print("Error writing export manifest: ", e)
+
+
+def read_delta_manifest(zip_file):
+    """Returns the delta manifest of a library zip, None for a full library."""
+    try:
+        delta = json.loads(zip_file.read(DELTA_MANIFEST).decode("utf8"))
+    except KeyError:
+        return None
+    if not isinstance(delta, dict) or not isinstance(delta.get("removed", []), list):
+        raise TypeError("Damaged delta manifest in the widget library")
+    return delta
+
+
+def read_applied_delta():
+    """Returns the export id of the last delta applied to this library."""
+    try:
+        with open(os.path.join(get_custom_dir(), DELTA_STATE), "r") as f:
+            return json.load(f).get("export_id")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def write_applied_delta(export_id):
+    try:
+        with open(os.path.join(get_custom_dir(), DELTA_STATE), "w") as f:
+            json.dump({"export_id": export_id}, f)
+    except OSError as e:
+        print("Error writing delta state: ", e)
+
+
+def iter_json_items(stream, chunk_size=JSON_STREAM_CHUNK_SIZE):
+    """Yields the (key, value) pairs of the top level json object in a binary stream, one at a time."""
+    decoder = json.JSONDecoder()
+    decode_text = codecs.getincrementaldecoder("utf8")().decode
+    buffer, pos, eof = "", 0, False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        # older libraries were exported with single quotes
+        buffer = buffer[pos:] + decode_text(chunk, final=eof).replace("'", '"')
+        pos = 0
+
+    def next_char():
+        nonlocal pos
+        while True:
+            pos = JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                return ""
+            read_more()
+
+    def decode_value():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # a value running up to the end of the buffer might continue in the next chunk
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            read_more()
+
+    if next_char() != "{":
+        raise TypeError("Expected a dictionary at the top of the json file")
+    pos += 1
+    if next_char() == "}":
+        return
+
+    while True:
+        next_char()
+        key = decode_value()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting property name", buffer, pos)
+        if next_char() != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", buffer, pos)
+        pos += 1
+        next_char()
+        yield key, decode_value()
+
+        char = next_char()
+        pos += 1
+        if char == "}":
+            return
+        if char != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos - 1)
 
 
 def import_widget_library(filepath, action=""):
     required_data_keys = ("vertices", "faces", "edges", "image")  # json data
-    wgts = {}
 
     from zipfile import ZipFile
     # dest_dir = os.path.abspath(os.path.join(get_addon_dir(), '..'))
@@ -242,94 +602,350 @@ def import_widget_library(filepath, action=""):
     widget_import.import_type = "widget"
 
     if os.path.exists(filepath) and action:
+        library_import_stats.update(widgets=0, parse_time=0.0, thumbnails=0, invalid_thumbnails=0,
+                                    extract_time=0.0, install_time=0.0)
         try:
+            start_time = time.perf_counter()
+            current_names = read_widget_names(JSON_USER_WIDGETS)
+            # geometry hash -> name of every widget in the library, for duplicate lookups
+            geometry_index = ensure_widget_data().geometry_index() if action == "SKIP" else {}
+            # versions of the library's widgets at the last merge of this file
+            merge_base = read_merge_base(filepath) if action == "MERGE" else {}
+            merge_changes = {}
 
             with ZipFile(filepath, 'r') as zip_file:
-                # extract images
-                for file in zip_file.namelist():
-                    if file.startswith('custom_thumbnails/'):
-                        zip_file.extract(file, dest_dir)
-                    elif file.endswith('.json'):  # extract data from the .json file
-                        f = zip_file.read(file)
-                        json_data = f.decode('utf8').replace("'", '"')
-                        wgts = json.loads(json_data)
-
-            # validate wgts data type
-            if not isinstance(wgts, dict):
-                raise TypeError(
-                    f"Expected a dictionary, but got {type(wgts).__name__}")
-
-            current_wgts = read_widgets(JSON_USER_WIDGETS)
-
-            # check for duplicate names
-            for name, data in sorted(wgts.items()):  # sorting by keys
-                widget_import.total_num_imports += 1
-                # validate json data
-                if not validate_json_data(data, required_data_keys):
-                    widget_import.failed_imports.append(Widget(name, data))
-                    continue
-
-                if action == "ASK":
-                    widget_import.skipped_imports.append(Widget(name, data))
-                elif action == "OVERWRITE":
-                    widget_import.imported_items.append(Widget(name, data))
-                elif action == "SKIP":
-                    # check for duplicates
-                    data_match = data == current_wgts[name]
-                    if data_match:
-                        widget_import.skipped_imports.append(
-                            Widget(name, data))
-                        # widget_import.duplicate_imports.update({name : data})
-                    elif name not in current_wgts:
-                        widget_import.imported_items.append(Widget(name, data))
-                    else:
-                        widget_import.skipped_imports.append(
-                            Widget(name, data))
-                else:
-                    widget_import.failed_imports.append(Widget(name, data))
-
-        except TypeError as e:  # Handle data type errors specifically
+                json_file = next((file for file in zip_file.namelist()
+                                  if file.endswith('.json') and file != DELTA_MANIFEST), None)
+                if json_file is None:
+                    raise TypeError("No json file found in the widget library")
+
+                # a delta only holds the changed widgets and lists the removed ones
+                widget_import.delta = read_delta_manifest(zip_file)
+                if widget_import.delta is not None:
+                    applied = read_applied_delta()
+                    if applied is not None and applied != widget_import.delta.get("base"):
+                        print("Warning: widget library delta was made on top of another export, "
+                              "updates in between are missing")
+                # crcs of the thumbnails, to tell changed images apart without extracting them
+                image_crcs = {info.filename.split('/', 1)[1]: info.CRC for info in zip_file.infolist()
+                              if info.filename.startswith('custom_thumbnails/')}
+
+                # widgets are validated one by one as they are parsed from the zip member
+                with zip_file.open(json_file) as stream:
+                    for name, data in iter_json_items(stream):
+                        widget_import.total_num_imports += 1
+                        # validate json data
+                        if not validate_json_data(data, required_data_keys):
+                            widget_import.failed_imports.append(Widget(name, data))
+                            merge_changes[name] = {"change": "failed"}
+                            continue
+
+                        if action == "ASK":
+                            widget_import.skipped_imports.append(Widget(name, data))
+                        elif action == "OVERWRITE":
+                            widget_import.imported_items.append(Widget(name, data))
+                        elif action == "SKIP":
+                            widget = Widget(name, data)
+                            # only existing names are skipped
+                            if name in current_names:
+                                widget_import.skipped_imports.append(widget)
+                                continue
+                            widget_import.imported_items.append(widget)
+
+                            # shapes the library already has under another name are imported
+                            # as well (they may come with their own thumbnail), only reported
+                            try:
+                                duplicate_of = geometry_index.setdefault(widget.geometry_hash, name)
+                            except MALFORMED_WIDGET_ERRORS:
+                                continue
+                            if duplicate_of != name:
+                                widget_import.duplicate_imports.append(widget)
+                        elif action == "MERGE":
+                            widget = Widget(name, data)
+                            try:
+                                change = merge_widget(widget, name in current_names,
+                                                      image_crcs, merge_base, merge_changes)
+                            except (ValueError, IndexError, TypeError):  # malformed geometry
+                                widget_import.failed_imports.append(widget)
+                                merge_changes[name] = {"change": "failed"}
+                                continue
+
+                            # only new and changed widgets are written, local edits are kept
+                            if change in CHANGES_TO_IMPORT:
+                                widget_import.imported_items.append(widget)
+                            else:
+                                widget_import.skipped_imports.append(widget)
+                        else:
+                            widget_import.failed_imports.append(Widget(name, data))
+
+                library_import_stats["widgets"] = widget_import.total_num_imports
+                library_import_stats["parse_time"] = time.perf_counter() - start_time
+
+                # extract the thumbnails while the archive is open, the ask popup previews
+                # them and update_widget_library copies them into the custom folder later on
+                widgets = widget_import.skipped_imports if action == "ASK" else widget_import.imported_items
+                thumbnail_dir = os.path.join(dest_dir, 'custom_thumbnails')
+                # don't mix in images of a previously imported library
+                shutil.rmtree(thumbnail_dir, ignore_errors=True)
+                extract_thumbnails(zip_file, {widget.image for widget in widgets}, dest_dir)
+                widget_import.thumbnail_dir = thumbnail_dir
+
+            if action == "MERGE":
+                widget_import.change_report = build_merge_report(filepath, merge_changes)
+
+            for widgets in (widget_import.failed_imports, widget_import.skipped_imports,
+                            widget_import.imported_items, widget_import.duplicate_imports):
+                widgets.sort(key=lambda widget: widget.name)
+
+        except (TypeError, ValueError) as e:  # Handle data type and parsing errors specifically
             print(f"Error while importing widget library: {e}")
+            # don't import half of a damaged file
+            widget_import = BoneWidgetImportData()
+            widget_import.import_type = "widget"
             widget_import.json_import_error = True
         except Exception as e:
             print(f"Error while importing widget library: {e}")
-            for name, data in wgts.items():
-                widget_import.failed_imports.append(Widget(name, data))
-                widget_import.total_num_imports = widget_import.failed()
+            widget_import.failed_imports.extend(widget_import.imported_items + widget_import.skipped_imports)
+            widget_import.imported_items = []
+            widget_import.skipped_imports = []
+            widget_import.total_num_imports = widget_import.failed()
     return widget_import
 
 
-def update_widget_library(new_widgets: dict[str, dict[str, list | str]],
-                          new_images: set[str], zip_filepath: str) -> None:
-    # store the currently selected widget
-    current_widget = bpy.context.window_manager.widget_list
-
-    wgts = read_widgets(JSON_USER_WIDGETS)
-    wgts.update(new_widgets)
-
-    write_widgets(wgts, JSON_USER_WIDGETS)
-
-    # extract any images needed from zip library
-    if new_images:
+def merge_widget(widget, in_library, image_crcs, merge_base, merge_changes):
+    """Classifies an incoming widget against the user library and records the change."""
+    name = widget.name
+    incoming = (widget.geometry_hash, widget.image, image_crcs.get(widget.image))
+
+    current = None
+    if in_library:
+        library = ensure_widget_data()
+        current = (library.geometry_hash(name), library.image(name), None)
+        # only read the local image when it's the one thing that could differ
+        if current[:2] == incoming[:2] and incoming[2] is not None:
+            current = current[:2] + (get_image_crc(current[1]),)
+
+    base = merge_base.get(name)
+    if base is not None:
+        base = (base.get("geometry_hash"), base.get("image"), base.get("image_crc"))
+
+    change = classify_widget_change(incoming, current, base)
+    merge_changes[name] = {
+        "change": change,
+        "geometry_hash": incoming[0],
+        "image": incoming[1],
+        "image_crc": incoming[2],
+    }
+    return change
+
+
+def get_image_crc(image):
+    """crc32 of a library thumbnail, None if it can't be found."""
+    for directory in (get_custom_image_dir('custom_thumbnails'), get_default_image_dir('thumbnails')):
+        try:
+            with open(os.path.join(directory, image), "rb") as f:
+                return zlib.crc32(f.read())
+        except OSError:
+            continue
+    return None
+
+
+def get_merge_source(filepath):
+    return os.path.normcase(os.path.abspath(filepath))
+
+
+def read_merge_reports():
+    """Returns {source path: report} of the last merge of every library file."""
+    report_path = os.path.join(get_custom_dir(), LIBRARY_MERGE_REPORT)
+    try:
+        with open(report_path, "r") as f:
+            reports = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(reports, dict) or not isinstance(reports.get("sources"), dict):
+        return {}
+    if reports.get("hash_version") != GEOMETRY_HASH_VERSION:
+        return {}  # hashed differently, every widget would look changed on both sides
+    return reports["sources"]
+
+
+def read_merge_base(filepath):
+    """Returns the widgets of the last merge report of this library file."""
+    report = read_merge_reports().get(get_merge_source(filepath))
+    if not isinstance(report, dict):
+        return {}
+    # failed widgets have no version to compare against
+    return {name: entry for name, entry in report.get("widgets", {}).items()
+            if isinstance(entry, dict) and entry.get("geometry_hash")}
+
+
+def build_merge_report(filepath, merge_changes):
+    """Returns the machine readable change report of a merge."""
+    summary = {}
+    for entry in merge_changes.values():
+        summary[entry["change"]] = summary.get(entry["change"], 0) + 1
+
+    return {
+        "source": get_merge_source(filepath),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "summary": summary,
+        "widgets": merge_changes,
+    }
+
+
+def write_merge_report(report):
+    """
+    Stores the report as the base of the next merge of the same library file,
+    call it only once the merge has been written to the library.
+    """
+    reports = read_merge_reports()
+    reports[report["source"]] = report
+    try:
+        with open(os.path.join(get_custom_dir(), LIBRARY_MERGE_REPORT), "w") as f:
+            json.dump({"version": 2, "hash_version": GEOMETRY_HASH_VERSION, "sources": reports}, f, indent=1)
+    except OSError as e:
+        print("Error writing merge report: ", e)
+
+
+def extract_thumbnails(zip_file, images, dest_dir, folder='custom_thumbnails'):
+    """
+    Extracts the given images from the thumbnail folder of an open zip file.
+
+    The members are read and validated on a thread pool, damaged PNGs are left out.
+    Returns the names of the images that were extracted.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from zipfile import BadZipFile
+    from .thumbnail_functions import validate_png
+
+    start_time = time.perf_counter()
+    members = set(zip_file.namelist())
+    # plain file names only, the names come from the library's json data
+    images = [image for image in images if image and image == os.path.basename(image)
+              and f"{folder}/{image}" in members]
+    target_dir = os.path.join(dest_dir, folder)
+    os.makedirs(target_dir, exist_ok=True)
+
+    def extract(image):
+        try:
+            # reading from one ZipFile in several threads is safe, the decompression runs in parallel
+            data = zip_file.read(f"{folder}/{image}")
+        except (BadZipFile, OSError) as e:
+            print("Error reading thumbnail: ", image, e)
+            return None
+        if image.lower().endswith(".png") and not validate_png(data):
+            print("Skipping damaged thumbnail: ", image)
+            return None
+        with open(os.path.join(target_dir, image), "wb") as f:
+            f.write(data)
+        return image
+
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_IMPORT_WORKERS) as pool:
+        extracted = {image for image in pool.map(extract, images) if image}
+
+    library_import_stats["thumbnails"] += len(extracted)
+    library_import_stats["invalid_thumbnails"] += len(images) - len(extracted)
+    library_import_stats["extract_time"] += time.perf_counter() - start_time
+    return extracted
+
+
+def install_thumbnails(images, thumbnail_dir, zip_filepath):
+    """
+    Copies imported thumbnails into the custom folder, from the folder the import
+    already extracted and validated them to, or else straight from the zip library.
+    """
+    start_time = time.perf_counter()
+    dest_dir = get_custom_dir()
+    target_dir = get_custom_image_dir('custom_thumbnails')
+    os.makedirs(target_dir, exist_ok=True)
+
+    def copy(image):
+        source = os.path.join(thumbnail_dir, image)
+        # images missing here were damaged or not part of the library
+        if os.path.isfile(source):
+            shutil.copyfile(source, os.path.join(target_dir, image))
+
+    if thumbnail_dir:
+        from concurrent.futures import ThreadPoolExecutor
+        images = [image for image in images if image and image == os.path.basename(image)]
+        with ThreadPoolExecutor(max_workers=THUMBNAIL_IMPORT_WORKERS) as pool:
+            list(pool.map(copy, images))
+    else:
+        # no import pass extracted them, read them from the zip library
         from zipfile import ZipFile
-        dest_dir = get_custom_dir()
         if os.path.exists(zip_filepath):
             try:
                 with ZipFile(zip_filepath, 'r') as zip_file:
-                    for file in zip_file.namelist():
-                        if file.startswith('custom_thumbnails/') and file.split("/")[1] in new_images:
-                            zip_file.extract(file, dest_dir)
+                    extract_thumbnails(zip_file, images, dest_dir)
             except Exception as e:
                 print("Failed to extract custom images: ", e)
         else:
             print("zip file path doesn't exist!! - ", zip_filepath)
 
+    library_import_stats["install_time"] = time.perf_counter() - start_time
+
+
+def update_widget_library(new_widgets: dict[str, dict[str, list | str]],
+                          new_images: set[str], zip_filepath: str, thumbnail_dir: str | None = None,
+                          delta: dict | None = None) -> None:
+    # store the currently selected widget
+    current_widget = bpy.context.window_manager.widget_list
+
+    # copy any images needed, from the import's extracted thumbnails or the zip library
+    if new_images:
+        install_thumbnails(new_images, thumbnail_dir, zip_filepath)
+
+    # draw thumbnails for widgets that came without an image
+    draw_missing_thumbnails(new_widgets)
+
+    # widgets removed since the export a delta was made against
+    removed = []
+    if delta is not None:
+        current_names = read_widget_names(JSON_USER_WIDGETS)
+        removed = [name for name in delta.get("removed", []) if name in current_names and name not in new_widgets]
+
+    write_widget_changes(new_widgets, removed, JSON_USER_WIDGETS)
+
+    if delta is not None and delta.get("export_id"):
+        write_applied_delta(delta["export_id"])
+
     # update the preview panel
-    update_preview_collection()
+    update_preview_collection(updated=new_widgets.keys(), removed=removed)
 
     # trigger an update and display original but updated widget
     bpy.context.window_manager.widget_list = current_widget
 
+    print("Widget library import: " + format_library_import_stats())
+
+
+def draw_missing_thumbnails(wgts):
+    """Rasterizes <name>.png into custom_thumbnails for widgets whose image can't be found."""
+    from .thumbnail_functions import rasterize_widget, write_png
+
+    directory = get_default_image_dir('thumbnails')
+    custom_directory = get_custom_image_dir('custom_thumbnails')
+
+    for name, data in wgts.items():
+        image = data.get("image")
+        if image and (os.path.exists(os.path.join(directory, image))
+                      or os.path.exists(os.path.join(custom_directory, image))):
+            continue
+
+        # never overwrite a thumbnail another widget may be using
+        image = name + ".png"
+        number = 1
+        while os.path.exists(os.path.join(custom_directory, image)) \
+                or os.path.exists(os.path.join(directory, image)):
+            image = f"{name}.{number:03}.png"
+            number += 1
+
+        try:
+            os.makedirs(custom_directory, exist_ok=True)
+            write_png(os.path.join(custom_directory, image), rasterize_widget(data))
+            data["image"] = image
+        except (OSError, ValueError, IndexError) as e:
+            print(f"Error drawing thumbnail for {name}: ", e)
+
 
 def update_custom_image(image_name):
     current_widget = bpy.context.window_manager.widget_list
@@ -339,17 +955,15 @@ def update_custom_image(image_name):
     current_widget_data['image'] = image_name
 
     # update and write the new data
-    wgts = read_widgets(JSON_USER_WIDGETS)
-    if current_widget in wgts:
-        wgts[current_widget] = current_widget_data
-        write_widgets(wgts, JSON_USER_WIDGETS)
+    if current_widget in read_widget_names(JSON_USER_WIDGETS):
+        write_widget_changes({current_widget: current_widget_data}, (), JSON_USER_WIDGETS)
     else:
         wgts = read_widgets(JSON_DEFAULT_WIDGETS)
         wgts[current_widget] = current_widget_data
         write_widgets(wgts, JSON_DEFAULT_WIDGETS)
 
     # update the preview panel
-    update_preview_collection()
+    update_preview_collection(updated=[current_widget])
 
     # trigger an update and display original but updated widget
     bpy.context.window_manager.widget_list = current_widget
@@ -366,7 +980,7 @@ def reset_default_images():
     write_widgets(wgts, JSON_DEFAULT_WIDGETS)
 
     # update the preview panel
-    update_preview_collection()
+    update_preview_collection(updated=wgts.keys())
 
     # trigger an update and display original but updated widget
     bpy.context.window_manager.widget_list = current_widget
@@ -374,16 +988,18 @@ def reset_default_images():
 
 ################ COLOR PRESETS ################
 
-def read_color_presets():
-    presets = {}
-
-    # Read the JSON file
-    json_file = get_custom_color_preset_dir()
+def _load_color_preset_file(json_file):
     if os.path.exists(json_file):
         with open(json_file, "r") as file:
-            presets = json.load(file)
+            return json.load(file)
+    return []
+
 
-    presets = {item["name"]: item for item in presets}  # convert to dictionary
+def read_color_presets():
+    # Read the JSON file
+    presets = file_cache.get(get_custom_color_preset_dir(), _load_color_preset_file)
+
+    presets = {item["name"]: dict(item) for item in presets}  # convert to dictionary
 
     return presets
 
@@ -483,49 +1099,46 @@ def colors_match(set1, set2):
             and set1.active == set2.active
 
 
-def scan_armature_color_presets(context, armature):
-    found_color_sets = set()
+# number of decimals colors are rounded to when comparing color sets by key
+COLOR_KEY_PRECISION = 4
+
+
+def color_set_key(color_set):
+    """Hashable key of a color set's normal/select/active colors, quantized so float noise still matches."""
+    if isinstance(color_set, dict):
+        colors = (color_set['normal'], color_set['select'], color_set['active'])
+    else:
+        colors = (color_set.normal, color_set.select, color_set.active)
+    return tuple(round(value, COLOR_KEY_PRECISION) for color in colors for value in color[:3])
 
+
+def scan_armature_color_presets(context, armature_objects):
     colorsets_import = BoneWidgetImportData()
     colorsets_import.import_type = "colorset"
 
-    current_color_sets = context.window_manager.custom_color_presets
-
-    # edit bones
-    for bone in armature.bones:
-        if bone.color.is_custom:
-            is_unique_colorset = True
-            for color_set in current_color_sets:
-                if colors_match(bone.color.custom, color_set):
-                    is_unique_colorset = False  # not unique
-                    break
-
-            color_data = (tuple(bone.color.custom.normal), tuple(
-                bone.color.custom.select), tuple(bone.color.custom.active))
-            if is_unique_colorset and not color_data in found_color_sets:
-                color_set = {attr: list(getattr(bone.color.custom, attr)[:3]) for attr in [
-                    "normal", "active", "select"]}
-                color_set['name'] = bone.name
-                colorsets_import.skipped_imports.append(ColorSet(color_set))
-                found_color_sets.add(color_data)
-
-        # pose bones
-        pose_bone = context.object.pose.bones.get(bone.name)
-        if pose_bone.color.is_custom:
-            is_unique_colorset = True
-            for color_set in current_color_sets:
-                if colors_match(pose_bone.color.custom, color_set):
-                    is_unique_colorset = False  # not unique
-                    break
-
-            color_data = (tuple(pose_bone.color.custom.normal), tuple(
-                pose_bone.color.custom.select), tuple(pose_bone.color.custom.active))
-            if is_unique_colorset and not color_data in found_color_sets:
-                color_set = {attr: list(getattr(pose_bone.color.custom, attr)[
-                                        :3]) for attr in ["normal", "active", "select"]}
-                color_set['name'] = bone.name
-                colorsets_import.skipped_imports.append(ColorSet(color_set))
-                found_color_sets.add(color_data)
+    # keys of the existing presets and of the color sets found so far
+    known_color_sets = {color_set_key(color_set)
+                        for color_set in context.window_manager.custom_color_presets}
+
+    def add_color_set(bone_color, name):
+        key = color_set_key(bone_color.custom)
+        if key in known_color_sets:
+            return
+        known_color_sets.add(key)
+        color_set = {attr: list(getattr(bone_color.custom, attr)[:3]) for attr in [
+            "normal", "active", "select"]}
+        color_set['name'] = name
+        colorsets_import.skipped_imports.append(ColorSet(color_set))
+
+    for obj in armature_objects:
+        for pose_bone in obj.pose.bones:
+            # edit bones
+            if pose_bone.bone.color.is_custom:
+                add_color_set(pose_bone.bone.color, pose_bone.name)
+
+            # pose bones
+            if pose_bone.color.is_custom:
+                add_color_set(pose_bone.color, pose_bone.name)
 
     return colorsets_import
 
@@ -628,20 +1241,20 @@ def save_color_sets(context):
         filepath = get_custom_color_preset_dir()
         with open(filepath, 'w') as f:
             json.dump(color_sets, f, indent=4)
+        file_cache.invalidate(filepath)
         bpy.context.window_manager.turn_off_colorset_save = False
 
 
 def load_color_presets():
     filepath = get_custom_color_preset_dir()
     if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            color_sets = json.load(f)
-            bpy.context.window_manager.custom_color_presets.clear()
-            bpy.context.window_manager.turn_off_colorset_save = True
-            for item in color_sets:
-                new_item = bpy.context.window_manager.custom_color_presets.add()
-                new_item.name = item["name"]
-                new_item.normal = item["normal"]
-                new_item.select = item["select"]
-                new_item.active = item["active"]
-            bpy.context.window_manager.turn_off_colorset_save = False
+        color_sets = file_cache.get(filepath, _load_color_preset_file)
+        bpy.context.window_manager.custom_color_presets.clear()
+        bpy.context.window_manager.turn_off_colorset_save = True
+        for item in color_sets:
+            new_item = bpy.context.window_manager.custom_color_presets.add()
+            new_item.name = item["name"]
+            new_item.normal = item["normal"]
+            new_item.select = item["select"]
+            new_item.active = item["active"]
+        bpy.context.window_manager.turn_off_colorset_save = False
@@ -0,0 +1,639 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+import numpy
+from collections.abc import Mapping
+
+# Binary widget library (.bwl)
+#
+# header | offset table | name index | vertices | edges | face sizes | face indices
+#
+# The offset table holds one row of int64 values per widget:
+#   vertex start, vertex count, edge start, edge count,
+#   face start, face count, loop start, loop count
+# The name index is a utf-8 json list of [name, image, geometry hash] entries in table order.
+# Widgets with identical geometry share the same rows of the geometry sections.
+# Every section starts on an 8 byte boundary so numpy.frombuffer can map it directly.
+# Vertices are always stored as float32, the precision Blender keeps mesh coordinates
+# in anyway. Values read back from the binary file match the json values to float32
+# precision (about 7 significant digits) and are written back to json in their
+# shortest float32 form.
+
+# User widgets are additionally journaled: every add/remove/image change is
+# appended as one json line to a .journal file next to the json file, which
+# is replayed on top of it when reading. Once the journal grows too large it
+# is compacted back into the json file with a temp file and an atomic rename.
+
+BINARY_MAGIC = b"BWLB"
+BINARY_VERSION = 3
+BINARY_EXTENSION = ".bwl"
+
+# magic, version, widget count, flags, source size, source mtime (ns), then offset/length of each section
+HEADER_FORMAT = "<4sIIIqq" + "QQ" * 6
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TABLE_COLUMNS = 8
+
+VERTEX_DTYPE = numpy.float32
+INDEX_DTYPE = numpy.int32
+
+# raised by widget_to_arrays/geometry_hash for malformed entries, e.g. ragged
+# vertices, edge indices past the vertex count, empty faces or non-dict entries
+MALFORMED_WIDGET_ERRORS = (ValueError, IndexError, TypeError, AttributeError)
+
+GEOMETRY_PRECISION = 5  # decimals vertices are rounded to for the geometry hash
+GEOMETRY_HASH_VERSION = 2  # stored with saved hashes, bump whenever geometry_hash changes
+
+JOURNAL_EXTENSION = ".journal"
+JOURNAL_COMPACT_MIN_SIZE = 1024 * 1024  # bytes
+JOURNAL_COMPACT_RATIO = 0.25  # compact when the journal exceeds this share of the json file
+
+
+def get_binary_path(json_path):
+    return os.path.splitext(json_path)[0] + BINARY_EXTENSION
+
+
+def _align(size, alignment=8):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def widget_to_arrays(widget):
+    """Returns (vertices, edges, face_sizes, face_indices) as flat numpy arrays."""
+    # the values can be numpy arrays (Widget.to_dict), so no truth value tests
+    vertices = widget.get("vertices")
+    vertices = numpy.asarray([] if vertices is None else vertices, dtype=numpy.float64).reshape(-1, 3)
+    edges = widget.get("edges")
+    edges = numpy.asarray([] if edges is None else edges, dtype=INDEX_DTYPE).reshape(-1, 2)
+
+    faces = widget.get("faces")
+    if faces is None:
+        faces = []
+    face_sizes = numpy.fromiter((len(face) for face in faces), dtype=INDEX_DTYPE, count=len(faces))
+    face_indices = numpy.fromiter((i for face in faces for i in face), dtype=INDEX_DTYPE,
+                                  count=int(face_sizes.sum()))
+    return vertices, edges, face_sizes, face_indices
+
+
+def geometry_hash(widget):
+    """
+    Content hash of a widget's geometry (dictionary or arrays), the image is not part of it.
+
+    Vertices are rounded to float32 (the precision of the binary library) and then to
+    GEOMETRY_PRECISION decimals and sorted, edges and faces are renumbered and put in a
+    canonical order, so the same shape gets the same hash whatever order its vertices
+    were saved in and whether it was read from json or from the binary library.
+    """
+    if isinstance(widget, dict):
+        widget = widget_to_arrays(widget)
+    vertices, edges, face_sizes, face_indices = widget
+
+    quantized = numpy.round(numpy.asarray(vertices, dtype=VERTEX_DTYPE).astype(numpy.float64).reshape(-1, 3)
+                            * 10 ** GEOMETRY_PRECISION).astype(numpy.int64)
+    unique_vertices, remap = numpy.unique(quantized, axis=0, return_inverse=True)
+    remap = remap.ravel()
+
+    edges = numpy.sort(remap[numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)], axis=1)
+    edges = numpy.unique(edges, axis=0)
+
+    # faces keep their winding, they only start at their lowest vertex
+    faces = []
+    for face in faces_from_arrays(face_sizes, remap[numpy.asarray(face_indices, dtype=numpy.int64)]):
+        start = face.index(min(face))
+        faces.append(tuple(face[start:] + face[:start]))
+    faces.sort()
+
+    digest = hashlib.sha1(unique_vertices.tobytes())
+    digest.update(edges.astype(numpy.int64).tobytes())
+    for face in faces:
+        digest.update(struct.pack(f"<{len(face) + 1}q", len(face), *face))
+    return digest.hexdigest()
+
+
+# change classes of an incoming widget compared to the library
+CHANGE_NEW = "new"
+CHANGE_IDENTICAL = "identical"
+CHANGE_GEOMETRY = "geometry_changed"
+CHANGE_IMAGE = "image_changed"
+CHANGE_LOCAL = "local_changed"  # only the library changed since the last merge, keep it
+CHANGE_CONFLICT = "conflict"  # both sides changed since the last merge
+CHANGES_TO_IMPORT = (CHANGE_NEW, CHANGE_GEOMETRY, CHANGE_IMAGE)
+
+
+def classify_widget_change(incoming, current, base=None):
+    """
+    Classifies an incoming widget against the library version and, for a
+    three-way merge, the version both had at the last merge.
+
+    Each version is a (geometry hash, image name, image crc) tuple or None when
+    the widget doesn't exist there, the crc is None when it isn't known.
+    """
+    if current is not None and _same_version(incoming, current):
+        return CHANGE_IDENTICAL
+
+    if base is not None:
+        # the incoming widget didn't change since the last merge, so the library
+        # changed (or removed) it since then
+        if _same_version(incoming, base):
+            return CHANGE_LOCAL
+        if current is not None and not _same_version(current, base):
+            return CHANGE_CONFLICT
+
+    if current is None:
+        return CHANGE_NEW
+    if incoming[0] != current[0]:
+        return CHANGE_GEOMETRY
+    return CHANGE_IMAGE
+
+
+def _same_version(a, b):
+    if a[0] != b[0] or a[1] != b[1]:
+        return False
+    # images with the same name only differ when both crcs are known
+    return a[2] is None or b[2] is None or a[2] == b[2]
+
+
+def faces_from_arrays(face_sizes, face_indices):
+    if not len(face_sizes):
+        return []
+    splits = numpy.cumsum(face_sizes)[:-1]
+    return [face.tolist() for face in numpy.split(face_indices, splits)]
+
+
+def write_binary_library(wgts, filepath, source_stat=None):
+    """Write a widget dictionary to a binary library file."""
+    names = list(wgts.keys())
+    table = numpy.zeros((len(names), TABLE_COLUMNS), dtype=numpy.int64)
+    vertex_blocks, edge_blocks, size_blocks, loop_blocks = [], [], [], []
+    counters = [0, 0, 0, 0]  # vertices, edges, faces, loops
+
+    hashes = []
+    stored_rows = {}  # exact geometry bytes -> row, to store duplicates once
+
+    for row, name in enumerate(names):
+        arrays = widget_to_arrays(wgts[name])
+        hashes.append(geometry_hash(arrays))
+
+        key = b"|".join(array.tobytes() for array in arrays)
+        if key in stored_rows:
+            table[row] = table[stored_rows[key]]
+            continue
+        stored_rows[key] = row
+
+        for column, (block, array) in enumerate(zip(
+                (vertex_blocks, edge_blocks, size_blocks, loop_blocks), arrays)):
+            table[row, column * 2] = counters[column]
+            table[row, column * 2 + 1] = len(array)
+            counters[column] += len(array)
+            block.append(array)
+
+    flags = 0  # reserved
+    index = json.dumps([[name, wgts[name].get("image", ""), digest]
+                        for name, digest in zip(names, hashes)]).encode("utf8")
+
+    sections = [
+        table.tobytes(),
+        index,
+        _concatenate(vertex_blocks, VERTEX_DTYPE, (0, 3)).tobytes(),
+        _concatenate(edge_blocks, INDEX_DTYPE, (0, 2)).tobytes(),
+        _concatenate(size_blocks, INDEX_DTYPE, (0,)).tobytes(),
+        _concatenate(loop_blocks, INDEX_DTYPE, (0,)).tobytes(),
+    ]
+
+    offsets = []
+    position = _align(HEADER_SIZE)
+    for section in sections:
+        offsets.extend((position, len(section)))
+        position = _align(position + len(section))
+
+    source_size, source_mtime = (source_stat.st_size, source_stat.st_mtime_ns) if source_stat else (-1, -1)
+    header = struct.pack(HEADER_FORMAT, BINARY_MAGIC, BINARY_VERSION, len(names), flags,
+                         source_size, source_mtime, *offsets)
+
+    temp_path = filepath + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        for section, offset in zip(sections, offsets[::2]):
+            f.seek(offset)
+            f.write(section)
+    os.replace(temp_path, filepath)
+
+
+def _concatenate(blocks, dtype, empty_shape):
+    if not blocks:
+        return numpy.empty(empty_shape, dtype=dtype)
+    return numpy.concatenate(blocks).astype(dtype, copy=False)
+
+
+def read_binary_header(buffer):
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError("Binary widget library is truncated")
+    header = struct.unpack_from(HEADER_FORMAT, buffer)
+    if header[0] != BINARY_MAGIC or header[1] != BINARY_VERSION:
+        raise ValueError("Not a binary widget library")
+    return header
+
+
+class BinaryWidgetLibrary:
+    """Widget library backed by the flat arrays of a .bwl file."""
+
+    def __init__(self, buffer):
+        header = read_binary_header(buffer)
+        count = header[2]
+        self.source_size = header[4]
+        self.source_mtime = header[5]
+        sections = [header[6 + i * 2: 8 + i * 2] for i in range(6)]
+
+        def section(i, dtype):
+            offset, length = sections[i]
+            if not length:
+                return numpy.empty(0, dtype=dtype)
+            return numpy.frombuffer(buffer, dtype=dtype, count=length // numpy.dtype(dtype).itemsize,
+                                    offset=offset)
+
+        self.table = section(0, numpy.int64).reshape(count, TABLE_COLUMNS)
+        offset, length = sections[1]
+        entries = json.loads(bytes(buffer[offset:offset + length]).decode("utf8"))
+        self.vertices = section(2, VERTEX_DTYPE).reshape(-1, 3)
+        self.edges = section(3, INDEX_DTYPE).reshape(-1, 2)
+        self.face_sizes = section(4, INDEX_DTYPE)
+        self.face_indices = section(5, INDEX_DTYPE)
+
+        self.names = [entry[0] for entry in entries]
+        self.images = {entry[0]: entry[1] for entry in entries}
+        self.hashes = {entry[0]: entry[2] for entry in entries}
+        self.rows = {name: row for row, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def widget_arrays(self, name):
+        """Returns numpy views (vertices, edges, face_sizes, face_indices) for a widget."""
+        vs, vc, es, ec, fs, fc, ls, lc = self.table[self.rows[name]]
+        return (self.vertices[vs:vs + vc],
+                self.edges[es:es + ec],
+                self.face_sizes[fs:fs + fc],
+                self.face_indices[ls:ls + lc])
+
+    def image(self, name):
+        return self.images[name]
+
+    def has_faces(self, name):
+        return bool(self.table[self.rows[name], 5])
+
+    def geometry_hash(self, name):
+        return self.hashes[name]
+
+    def widget(self, name):
+        """Returns the widget as a dictionary matching the json structure."""
+        vertices, edges, face_sizes, face_indices = self.widget_arrays(name)
+        return {
+            # str gives the shortest float32 form, tolist would write 0.1 as 0.10000000149011612
+            "vertices": [[float(str(value)) for value in vertex] for vertex in vertices],
+            "edges": edges.tolist(),
+            "faces": faces_from_arrays(face_sizes, face_indices),
+            "image": self.images[name],
+        }
+
+    def to_dict(self):
+        return {name: self.widget(name) for name in self.names}
+
+
+def read_binary_library(filepath):
+    with open(filepath, "rb") as f:
+        return BinaryWidgetLibrary(f.read())
+
+
+class MappedWidgetLibrary(BinaryWidgetLibrary):
+    """
+    Binary widget library read through a memory map.
+
+    Only the header, offset table and name index are touched on load, the
+    geometry pages are read by the OS when a widget is actually requested.
+    """
+
+    def __init__(self, filepath):
+        with open(filepath, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        super().__init__(self._map)
+
+    def close(self):
+        # the map can only be closed once no numpy views point into it
+        self.table = self.vertices = self.edges = self.face_sizes = self.face_indices = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # views handed out are still alive, the map is freed with them
+
+
+def open_mapped_library(json_path):
+    """
+    Memory maps the binary counterpart of a widget json file, creating it if needed.
+
+    Falls back to the parsed json file when there's no usable binary file, e.g.
+    when it can't be written or the json file holds malformed widgets.
+    """
+    binary_path = get_binary_path(json_path)
+    if not is_binary_current(binary_path, json_path):
+        # (re)converts the json file or restores it from the binary
+        wgts = load_widget_file(json_path)
+        if not is_binary_current(binary_path, json_path):
+            return _DictWidgetLibrary(wgts)
+    try:
+        return MappedWidgetLibrary(binary_path)
+    except (OSError, ValueError) as e:
+        print("Failed to map binary widget library: ", e)
+        return _DictWidgetLibrary(load_widget_file(json_path))
+
+
+class LazyWidgetData(Mapping):
+    """
+    Read-only view over several widget files, later files override earlier ones.
+
+    Names and images are available immediately, vertices/edges/faces are only
+    built when a widget is looked up.
+    """
+
+    def __init__(self, json_paths):
+        self._libraries = []
+        self._owners = {}
+        for json_path in json_paths:
+            library = open_mapped_library(json_path)
+            self._libraries.append(library)
+            for name in library.names:
+                self._owners[name] = library
+
+            # replay the journal on top of the json file
+            changes = {}
+            for name, data in iter_journal_changes(read_journal(get_journal_path(json_path))):
+                if data is None:
+                    self._owners.pop(name, None)
+                    changes.pop(name, None)
+                else:
+                    changes[name] = data
+            if changes:
+                overlay = _DictWidgetLibrary(changes)
+                self._libraries.append(overlay)
+                for name in changes:
+                    self._owners[name] = overlay
+
+    def __getitem__(self, name):
+        return self._owners[name].widget(name)
+
+    def __iter__(self):
+        return iter(self._owners)
+
+    def __len__(self):
+        return len(self._owners)
+
+    def __contains__(self, name):
+        return name in self._owners
+
+    def image(self, name):
+        return self._owners[name].image(name)
+
+    def has_faces(self, name):
+        return self._owners[name].has_faces(name)
+
+    def widget_arrays(self, name):
+        return self._owners[name].widget_arrays(name)
+
+    def geometry_hash(self, name):
+        return self._owners[name].geometry_hash(name)
+
+    def geometry_index(self):
+        """Returns {geometry hash: widget name}, for duplicate lookups."""
+        index = {self.geometry_hash(name): name for name in self._owners}
+        index.pop(None, None)  # malformed widgets
+        return index
+
+    def close(self):
+        for library in self._libraries:
+            if isinstance(library, MappedWidgetLibrary):
+                library.close()
+        self._libraries = []
+        self._owners = {}
+
+
+class _DictWidgetLibrary:
+    """Fallback for LazyWidgetData when a json file can't be mapped."""
+
+    def __init__(self, wgts):
+        self._wgts = wgts
+        self._hashes = {}
+        self.names = list(wgts.keys())
+
+    def image(self, name):
+        return self._wgts[name].get("image", "")
+
+    def has_faces(self, name):
+        return bool(self._wgts[name].get("faces"))
+
+    def widget_arrays(self, name):
+        return widget_to_arrays(self._wgts[name])
+
+    def geometry_hash(self, name):
+        if name not in self._hashes:
+            try:
+                self._hashes[name] = geometry_hash(self._wgts[name])
+            except MALFORMED_WIDGET_ERRORS:
+                self._hashes[name] = None  # malformed widget, it matches nothing
+        return self._hashes[name]
+
+    def widget(self, name):
+        return dict(self._wgts[name])
+
+
+def is_binary_current(binary_path, json_path):
+    """Checks the binary library was converted from the current json file."""
+    try:
+        json_stat = os.stat(json_path)
+        with open(binary_path, "rb") as f:
+            header = read_binary_header(f.read(HEADER_SIZE))
+    except (OSError, ValueError):
+        return False
+    return header[4] == json_stat.st_size and header[5] == json_stat.st_mtime_ns
+
+
+def json_to_binary(json_path, binary_path=None):
+    binary_path = binary_path or get_binary_path(json_path)
+    with open(json_path, "r") as f:
+        wgts = json.load(f)
+    write_binary_library(wgts, binary_path, os.stat(json_path))
+    return wgts
+
+
+def binary_to_json(binary_path, json_path):
+    wgts = read_binary_library(binary_path).to_dict()
+    atomic_write(json_path, json.dumps(wgts, default=json_default))
+    # the binary now mirrors the freshly written json
+    write_binary_library(wgts, binary_path, os.stat(json_path))
+    return wgts
+
+
+def load_widget_file(json_path):
+    """
+    Reads a widget json file through its binary counterpart.
+
+    The binary file is (re)generated whenever it is missing or out of date,
+    and the json file is restored from the binary file if only the latter exists.
+    """
+    binary_path = get_binary_path(json_path)
+
+    if not os.path.exists(json_path):
+        if os.path.exists(binary_path):
+            try:
+                return binary_to_json(binary_path, json_path)
+            except (OSError, ValueError) as e:
+                print("Failed to restore widget library from binary file: ", e)
+        return {}
+
+    if is_binary_current(binary_path, json_path):
+        try:
+            return read_binary_library(binary_path).to_dict()
+        except (OSError, ValueError) as e:
+            print("Failed to read binary widget library: ", e)
+
+    with open(json_path, "r") as f:
+        wgts = json.load(f)
+    try:
+        write_binary_library(wgts, binary_path, os.stat(json_path))
+    except OSError as e:  # read-only location, keep using the json file
+        print("Failed to write binary widget library: ", e)
+    except MALFORMED_WIDGET_ERRORS as e:  # malformed widget, keep using the json file
+        print("Failed to convert widget library " + json_path + ": ", e)
+    return wgts
+
+
+def save_widget_file(wgts, json_path):
+    """Writes the json file and keeps the binary counterpart in sync."""
+    atomic_write(json_path, json.dumps(wgts, default=json_default))
+    # the json file now holds everything the journal recorded
+    remove_journal(json_path)
+    try:
+        write_binary_library(wgts, get_binary_path(json_path), os.stat(json_path))
+    except OSError as e:
+        print("Failed to write binary widget library: ", e)
+    except MALFORMED_WIDGET_ERRORS as e:
+        print("Failed to convert widget library " + json_path + ": ", e)
+
+
+def json_default(value):
+    """Lets json.dumps write numpy arrays and scalars, e.g. from Widget.to_dict."""
+    if isinstance(value, (numpy.ndarray, numpy.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def atomic_write(filepath, text):
+    """Writes text to a temp file and renames it over filepath, so readers never see a partial file."""
+    temp_path = filepath + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, filepath)
+
+
+################ JOURNAL ################
+
+def get_journal_path(json_path):
+    return os.path.splitext(json_path)[0] + JOURNAL_EXTENSION
+
+
+def read_journal(journal_path):
+    """Returns the journal records, torn records from interrupted writes are skipped."""
+    records = []
+    if not os.path.exists(journal_path):
+        return records
+    with open(journal_path, "r") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # last record was never finished
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "name" in record:
+                records.append(record)
+    return records
+
+
+def iter_journal_changes(records):
+    """Yields (name, widget data) for every record, data is None for removed widgets."""
+    for record in records:
+        yield record["name"], record.get("data")
+
+
+def apply_journal(wgts, records):
+    for name, data in iter_journal_changes(records):
+        if data is None:
+            wgts.pop(name, None)
+        else:
+            wgts[name] = data
+    return wgts
+
+
+def append_widget_records(json_path, updated=None, removed=()):
+    """
+    Records added/changed and removed widgets in the journal of a widget json file.
+
+    Only the changed widgets are written. Returns True if the journal was compacted
+    into the json file afterwards.
+    """
+    lines = [json.dumps({"name": name, "data": data}, default=json_default)
+             for name, data in (updated or {}).items()]
+    lines.extend(json.dumps({"name": name}) for name in removed)
+    if not lines:
+        return False
+
+    journal_path = get_journal_path(json_path)
+    if _ends_with_torn_record(journal_path):
+        lines.insert(0, "")  # terminate it so it doesn't swallow the next record
+    with open(journal_path, "a") as f:
+        f.write("\n".join(lines) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    journal_size = os.path.getsize(journal_path)
+    json_size = os.path.getsize(json_path) if os.path.exists(json_path) else 0
+    if journal_size > max(JOURNAL_COMPACT_MIN_SIZE, json_size * JOURNAL_COMPACT_RATIO):
+        compact_widget_file(json_path)
+        return True
+    return False
+
+
+def _ends_with_torn_record(journal_path):
+    try:
+        with open(journal_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if not f.tell():
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    except OSError:
+        return False
+
+
+def compact_widget_file(json_path):
+    """Folds the journal into the json file, does nothing if there is no journal."""
+    journal_path = get_journal_path(json_path)
+    if not os.path.exists(journal_path):
+        return
+    wgts = apply_journal(load_widget_file(json_path), read_journal(journal_path))
+    save_widget_file(wgts, json_path)
+
+
+def remove_journal(json_path):
+    try:
+        os.remove(get_journal_path(json_path))
+    except FileNotFoundError:
+        pass
+
+
+def load_widget_library(json_path):
+    """Reads a widget json file with its journal applied."""
+    return apply_journal(load_widget_file(json_path), read_journal(get_journal_path(json_path)))
@@ -1,8 +1,26 @@
 import bpy
 import numpy
+import hashlib
+import time
+from bpy.app.handlers import persistent
 from mathutils import Matrix, Vector
+from .library_functions import widget_to_arrays, geometry_hash
 from .. import __package__
 
+# custom property holding the instancing key of a shared widget mesh
+SHARED_MESH_KEY = "bw_shared_widget_key"
+# custom property holding the geometry hash of the library widget a shared mesh was built from
+SHARED_MESH_GEOMETRY = "bw_shared_widget_geometry"
+
+# widget object pointer -> (armature object, bone name), rebuilt on demand
+widget_bone_index = {
+    "scene": None,
+    "widgets": None,
+    "misses": set(),  # pointers of objects known not to be a widget
+    "armatures": {},  # armature pointer -> custom shapes of its bones when the index was built
+    "object_count": 0,
+}
+
 
 def get_collection(context):
     # check user preferences for the name of the collection
@@ -93,17 +111,177 @@ def match_bone_matrix(widget, match_bone):
     widget.data.update()
 
 
-def from_widget_find_bone(widget):
-    match_bone = None
-    for ob in bpy.context.scene.objects:
+def _custom_shape_signature(armature):
+    return tuple((bone.name, bone.custom_shape.as_pointer() if bone.custom_shape else 0)
+                 for bone in armature.pose.bones)
+
+
+def build_widget_bone_index(scene):
+    widgets = {}
+    armatures = {}
+    for ob in scene.objects:
         if ob.type == "ARMATURE":
             for bone in ob.pose.bones:
-                if bone.custom_shape == widget:
-                    match_bone = bone
-    return match_bone
+                if bone.custom_shape:
+                    widgets[bone.custom_shape.as_pointer()] = (ob, bone.name)
+            armatures[ob.as_pointer()] = _custom_shape_signature(ob)
+    widget_bone_index["scene"] = scene.as_pointer()
+    widget_bone_index["widgets"] = widgets
+    widget_bone_index["misses"] = set()
+    widget_bone_index["armatures"] = armatures
+    widget_bone_index["object_count"] = len(bpy.data.objects)
+    return widgets
+
+
+def invalidate_widget_bone_index():
+    widget_bone_index["scene"] = None
+    widget_bone_index["widgets"] = None
+    widget_bone_index["misses"] = set()
+    widget_bone_index["armatures"] = {}
+
+
+def _lookup_widget_bone(widgets, widget):
+    entry = widgets.get(widget.as_pointer())
+    if entry is None:
+        return None
+    armature, bone_name = entry
+    try:
+        bone = armature.pose.bones.get(bone_name)
+    except ReferenceError:  # the armature was removed
+        return False
+    if bone is None or bone.custom_shape != widget:
+        return False  # out of date
+    return bone
+
+
+def from_widget_find_bone(widget):
+    if widget is None:
+        return None
+    scene = bpy.context.scene
+    widgets = widget_bone_index["widgets"]
+    if widgets is None or widget_bone_index["scene"] != scene.as_pointer():
+        widgets = build_widget_bone_index(scene)
+
+    pointer = widget.as_pointer()
+    if pointer in widget_bone_index["misses"]:
+        return None
+
+    match_bone = _lookup_widget_bone(widgets, widget)
+    if match_bone is False:
+        # stale entry, the handlers may not have run yet
+        match_bone = _lookup_widget_bone(build_widget_bone_index(scene), widget)
+    if not match_bone:
+        # not a widget, remembered until the next invalidation
+        widget_bone_index["misses"].add(pointer)
+    return match_bone or None
+
+
+@persistent
+def widget_bone_index_depsgraph_update(scene, depsgraph):
+    if widget_bone_index["widgets"] is None:
+        return
+    # objects were added or removed
+    if len(bpy.data.objects) != widget_bone_index["object_count"]:
+        invalidate_widget_bone_index()
+        return
+
+    armatures = widget_bone_index["armatures"]
+    for update in depsgraph.updates:
+        # posing and moving only tag transforms, custom shapes live on the armature's pose
+        if not update.is_updated_geometry or not isinstance(update.id, bpy.types.Object) \
+                or update.id.type != 'ARMATURE':
+            continue
+        armature = update.id.original
+        signature = armatures.get(armature.as_pointer())
+        if signature is None or signature != _custom_shape_signature(armature):
+            invalidate_widget_bone_index()
+            return
+
+
+@persistent
+def widget_bone_index_reset(*args):
+    invalidate_widget_bone_index()
+
+
+widget_bone_index_handlers = (
+    (bpy.app.handlers.depsgraph_update_post, widget_bone_index_depsgraph_update),
+    (bpy.app.handlers.undo_post, widget_bone_index_reset),
+    (bpy.app.handlers.redo_post, widget_bone_index_reset),
+    (bpy.app.handlers.load_post, widget_bone_index_reset),
+)
+
+
+def register_handlers():
+    for handler_list, handler in widget_bone_index_handlers:
+        if handler not in handler_list:
+            handler_list.append(handler)
+
+
+def unregister_handlers():
+    for handler_list, handler in widget_bone_index_handlers:
+        if handler in handler_list:
+            handler_list.remove(handler)
+    invalidate_widget_bone_index()
+
+
+def fill_mesh_from_arrays(mesh, vertices, edges, face_sizes=None, face_indices=None):
+    """Fills an empty mesh with foreach_set, the vectorized alternative to Mesh.from_pydata."""
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", numpy.ascontiguousarray(vertices, dtype=numpy.float32).ravel())
+
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set("vertices", numpy.ascontiguousarray(edges, dtype=numpy.int32).ravel())
+
+    if face_sizes is not None and len(face_sizes):
+        loop_starts = numpy.zeros(len(face_sizes), dtype=numpy.int32)
+        numpy.cumsum(face_sizes[:-1], out=loop_starts[1:])
 
+        mesh.loops.add(len(face_indices))
+        mesh.loops.foreach_set("vertex_index", numpy.ascontiguousarray(face_indices, dtype=numpy.int32))
+        mesh.polygons.add(len(face_sizes))
+        mesh.polygons.foreach_set("loop_start", loop_starts)
+        # older versions store the face size separately
+        if not bpy.types.MeshPolygon.bl_rna.properties["loop_total"].is_readonly:
+            mesh.polygons.foreach_set("loop_total", numpy.ascontiguousarray(face_sizes, dtype=numpy.int32))
 
-def create_widget(bone, widget, relative, size, slide, rotation, collection, use_face_data, wireframe_width):
+
+def shared_mesh_key(widget_name, widget_geometry, size, slide, rotation, use_face_data):
+    """
+    Hashes everything that ends up in the mesh data of a created widget, the geometry
+    hash makes sure a widget edited in the library doesn't reuse meshes of its old shape.
+    """
+    values = (widget_name, widget_geometry, tuple(round(v, 6) for v in size), tuple(round(v, 6) for v in slide),
+              tuple(round(v, 6) for v in rotation), bool(use_face_data))
+    return hashlib.sha1(repr(values).encode("utf8")).hexdigest()
+
+
+def get_shared_widget_meshes():
+    """Returns the shared widget meshes of the file by their instancing key."""
+    return {mesh[SHARED_MESH_KEY]: mesh for mesh in bpy.data.meshes
+            if SHARED_MESH_KEY in mesh and not mesh.library}
+
+
+def make_single_user_mesh(widget):
+    """Gives the widget its own copy of the mesh data if it is shared, before it gets edited."""
+    if widget.data.users > 1:
+        widget.data = widget.data.copy()
+        widget.data.name = widget.name
+    for key in (SHARED_MESH_KEY, SHARED_MESH_GEOMETRY):
+        if key in widget.data:
+            del widget.data[key]
+
+
+def create_widget(bone, widget, relative, size, slide, rotation, collection, use_face_data, wireframe_width,
+                  widget_name="", shared_meshes=None, widget_geometry=None):
+    """
+    Creates the widget object for a pose bone.
+
+    widget is either the widget dictionary or the (vertices, edges, face_sizes, face_indices)
+    arrays of it, the latter avoids converting the geometry again for every bone.
+    When a shared_meshes dictionary (see get_shared_widget_meshes) is passed, bones with the
+    same widget and parameters share a single mesh datablock. widget_geometry is the geometry
+    hash of the widget, it is computed when not passed.
+    """
     if not get_preferences(bpy.context).use_rigify_defaults:
         bw_widget_prefix = get_preferences(bpy.context).widget_prefix
     else:
@@ -116,37 +294,30 @@ def create_widget(bone, widget, relative, size, slide, rotation, collection, use
         bpy.data.objects.remove(
             bpy.data.objects[bone.custom_shape.name], do_unlink=True)
 
-    # make the data name include the prefix
-    new_data = bpy.data.meshes.new(bw_widget_prefix + bone.name)
-
     bone.use_custom_shape_bone_size = relative
 
-    # deal with face data
-    faces = widget['faces'] if use_face_data else []
-
-    # add the verts
-    new_data.from_pydata(numpy.array(
-        widget['vertices']) * size, widget['edges'], faces)
-
-    # Create transform matrices (slide vector and rotation)
-    widget_matrix = Matrix()
-
     # make the slide value always relative to the bone length
     if not relative:  # TODO: shift this to user preference?
         slide = Vector(slide)  # turn slide into a vector
         slide *= bone.length
-    trans = Matrix.Translation(slide)
-
-    rot = rotation.to_matrix().to_4x4()
-
-    # Translate then rotate the matrix
-    widget_matrix = widget_matrix @ trans
-    widget_matrix = widget_matrix @ rot
 
-    # transform the widget with this matrix
-    new_data.transform(widget_matrix)
-
-    new_data.update(calc_edges=True)
+    new_data = None
+    if shared_meshes is not None:
+        if widget_geometry is None:
+            widget_geometry = geometry_hash(widget)
+        key = shared_mesh_key(widget_name, widget_geometry, size, slide, rotation, use_face_data)
+        new_data = shared_meshes.get(key)
+        # meshes found through their custom property may predate a change of the widget
+        if new_data is not None and new_data.get(SHARED_MESH_GEOMETRY) != widget_geometry:
+            new_data = None
+
+    if new_data is None:
+        new_data = build_widget_mesh(bw_widget_prefix + (widget_name if shared_meshes is not None else bone.name),
+                                     widget, size, slide, rotation, use_face_data)
+        if shared_meshes is not None:
+            new_data[SHARED_MESH_KEY] = key
+            new_data[SHARED_MESH_GEOMETRY] = widget_geometry
+            shared_meshes[key] = new_data
 
     new_object = bpy.data.objects.new(bw_widget_prefix + bone.name, new_data)
 
@@ -161,6 +332,7 @@ def create_widget(bone, widget, relative, size, slide, rotation, collection, use
     layer.update()
 
     bone.custom_shape = new_object
+    invalidate_widget_bone_index()  # before the depsgraph handler gets to it
     # show faces if use face data is enabled
     bone.bone.show_wire = not use_face_data
 
@@ -168,6 +340,40 @@ def create_widget(bone, widget, relative, size, slide, rotation, collection, use
         bone.custom_shape_wire_width = wireframe_width
 
 
+def build_widget_mesh(name, widget, size, slide, rotation, use_face_data):
+    # make the data name include the prefix
+    new_data = bpy.data.meshes.new(name)
+
+    if isinstance(widget, dict):
+        widget = widget_to_arrays(widget)
+    vertices, edges, face_sizes, face_indices = widget
+
+    # Create transform matrices (slide vector and rotation)
+    widget_matrix = Matrix()
+    trans = Matrix.Translation(slide)
+
+    rot = rotation.to_matrix().to_4x4()
+
+    # Translate then rotate the matrix
+    widget_matrix = widget_matrix @ trans
+    widget_matrix = widget_matrix @ rot
+
+    # scale and transform the verts with this matrix
+    widget_matrix = numpy.array(widget_matrix, dtype=numpy.float32)
+    coords = (numpy.asarray(vertices, dtype=numpy.float32) * numpy.asarray(size, dtype=numpy.float32)) \
+        @ widget_matrix[:3, :3].T + widget_matrix[:3, 3]
+
+    # deal with face data
+    if use_face_data:
+        fill_mesh_from_arrays(new_data, coords, edges, face_sizes, face_indices)
+    else:
+        fill_mesh_from_arrays(new_data, coords, edges)
+
+    new_data.update(calc_edges=True)
+
+    return new_data
+
+
 def symmetrize_widget(bone, collection):
     if not get_preferences(bpy.context).use_rigify_defaults:
         bw_widget_prefix = get_preferences(bpy.context).widget_prefix
@@ -193,6 +399,8 @@ def symmetrize_widget(bone, collection):
 
     # create mirrored mesh data
     new_data = widget.data.copy()
+    if SHARED_MESH_KEY in new_data:
+        del new_data[SHARED_MESH_KEY]  # the mirrored copy is never shared
     for vert in new_data.vertices:
         vert.co.x *= -1  # mirror along X-axis
 
@@ -210,6 +418,7 @@ def symmetrize_widget(bone, collection):
     bpy.context.view_layer.update()
 
     mirror_bone.custom_shape = new_object
+    invalidate_widget_bone_index()  # before the depsgraph handler gets to it
     mirror_bone.bone.show_wire = bone.bone.show_wire
     mirror_bone.use_custom_shape_bone_size = bone.use_custom_shape_bone_size
 
@@ -246,34 +455,44 @@ def symmetrize_widget_helper(bone, collection, active_object, widgets_and_bones)
             symmetrize_widget(bone, collection)
 
 
-def delete_unused_widgets():
+def delete_unused_widgets(dry_run=False):
+    """
+    Deletes the objects in the widget collection that no bone uses as custom shape.
+
+    Returns the names of the (to be) deleted objects and the time the scan took in seconds.
+    With dry_run nothing is deleted.
+    """
     if not get_preferences(bpy.context).use_rigify_defaults:
         bw_collection_name = get_preferences(
             bpy.context).bonewidget_collection_name
     else:
         bw_collection_name = 'WGTS_' + bpy.context.active_object.name
 
+    start_time = time.perf_counter()
+
     collection = recursive_layer_collection(
         bpy.context.scene.collection, bw_collection_name)
-    widget_list = []
 
-    for ob in bpy.data.objects:
-        if ob.type == 'ARMATURE':
-            for bone in ob.pose.bones:
-                if bone.custom_shape:
-                    widget_list.append(bone.custom_shape)
+    used_widgets = {bone.custom_shape.as_pointer()
+                    for ob in bpy.data.objects if ob.type == 'ARMATURE'
+                    for bone in ob.pose.bones if bone.custom_shape}
 
     unwanted_list = [
-        ob for ob in collection.all_objects if ob not in widget_list]
+        ob for ob in collection.all_objects if ob.as_pointer() not in used_widgets]
+    unwanted_names = [ob.name for ob in unwanted_list]
+
+    scan_time = time.perf_counter() - start_time
 
-    for ob in unwanted_list:
-        bpy.data.objects.remove(bpy.data.objects[ob.name], do_unlink=True)
+    if not dry_run and unwanted_list:
+        bpy.data.batch_remove(unwanted_list)
 
-    return
+    return unwanted_names, scan_time
 
 
 def edit_widget(active_bone):
     widget = active_bone.custom_shape
+    # don't let the edit change the widgets of other bones
+    make_single_user_mesh(widget)
 
     collection = get_view_layer_collection(bpy.context, widget)
     collection.hide_viewport = False
@@ -422,6 +641,7 @@ def clear_bone_widgets():
         for bone in bpy.context.selected_pose_bones:
             if bone.custom_shape:
                 bone.custom_shape = None
+                invalidate_widget_bone_index()  # before the depsgraph handler gets to it
                 bone.custom_shape_transform = None
 
 
@@ -467,84 +687,118 @@ def add_object_as_widget(context, collection):
         layer.update()
 
         active_bone.custom_shape = widget
+        invalidate_widget_bone_index()  # before the depsgraph handler gets to it
         active_bone.bone.show_wire = True
 
         # deselect original object
         widget_object.select_set(False)
 
 
-def set_bone_color(context, color, clear_both_modes=None):
+# timings of the last set_bone_color call, for profiling bulk recoloring
+bone_color_stats = {
+    "bones": 0,
+    "time": 0.0,
+    "time_per_bone": 0.0,
+}
+
+COLOR_SET_ATTRIBUTES = ("normal", "select", "active")
+
+
+def get_color_set_values(color_set):
+    return tuple(tuple(getattr(color_set, attr)) for attr in COLOR_SET_ATTRIBUTES)
+
+
+def collect_bone_color_targets(context, color, clear_both_modes=None):
+    """
+    Works out which palette and custom colors every selected bone color should get.
+
+    Returns {(palette, custom colors or None): [bone colors]}, the preferences and
+    the custom colors are only read once for all bones.
+    """
+    targets = {}
+
+    def add(bone_color, palette, custom_colors=None):
+        key = (palette, custom_colors if palette == "CUSTOM" else None)
+        targets.setdefault(key, []).append(bone_color)
+
+    edit_bone_colors = get_preferences(context).edit_bone_colors
+
     if context.object.mode == "POSE":
         if color == 'DEFAULT' and clear_both_modes != None:
             for bone in context.selected_pose_bones:
-                bone.color.palette = 'DEFAULT'
-
+                add(bone.color, 'DEFAULT')
                 if clear_both_modes:
-                    bone.bone.color.palette = 'DEFAULT'
-            return
+                    add(bone.bone.color, 'DEFAULT')
+            return targets
 
-        for bone in context.selected_pose_bones:
-            bone.color.palette = color  # this will get the selected bone color
+        custom_colors = get_color_set_values(
+            context.scene.bw_settings.custom_pose_color_set) if color == "CUSTOM" else None
 
-            if color == "CUSTOM":
-                bone.color.custom.normal = context.scene.bw_settings.custom_pose_color_set.normal
-                bone.color.custom.select = context.scene.bw_settings.custom_pose_color_set.select
-                bone.color.custom.active = context.scene.bw_settings.custom_pose_color_set.active
+        for bone in context.selected_pose_bones:
+            add(bone.color, color, custom_colors)
 
             # set the edit bone colors if applicable (while in pose mode)
-            if get_preferences(context).edit_bone_colors == 'DEFAULT':
-                bone.bone.color.palette = 'DEFAULT'  # this will reset the edit bone color
-
-            elif get_preferences(context).edit_bone_colors == 'LINKED':
-                bone.bone.color.palette = color  # set the edit bone colors
-
-                # Set the custom color to edit bones (if applicable)
-                if color == "CUSTOM":
-                    bone.bone.color.custom.normal = context.scene.bw_settings.custom_pose_color_set.normal
-                    bone.bone.color.custom.select = context.scene.bw_settings.custom_pose_color_set.select
-                    bone.bone.color.custom.active = context.scene.bw_settings.custom_pose_color_set.active
+            if edit_bone_colors == 'DEFAULT':
+                add(bone.bone.color, 'DEFAULT')  # this will reset the edit bone color
+            elif edit_bone_colors == 'LINKED':
+                add(bone.bone.color, color, custom_colors)
 
     elif context.object.mode == "EDIT":
+        pose_bones = context.object.pose.bones
+
         if color == 'DEFAULT' and clear_both_modes != None:
             for edit_bone in context.selected_bones:
-                edit_bone.color.palette = 'DEFAULT'
-
+                add(edit_bone.color, 'DEFAULT')
                 if clear_both_modes:
-                    pose_bone = context.object.pose.bones.get(edit_bone.name)
-                    pose_bone.color.palette = 'DEFAULT'
+                    add(pose_bones.get(edit_bone.name).color, 'DEFAULT')
+            return targets
 
-            return
+        custom_colors = get_color_set_values(
+            context.scene.bw_settings.custom_edit_color_set) if color == "CUSTOM" else None
 
         for edit_bone in context.selected_bones:
-            if get_preferences(context).edit_bone_colors == 'DEFAULT':
+            if edit_bone_colors == 'DEFAULT':
                 # this will get the edit bone color back to default
-                edit_bone.color.palette = 'DEFAULT'
-
-            elif get_preferences(context).edit_bone_colors == 'LINKED':
-                edit_bone.color.palette = color  # set the edit mode color
-
-                # get the pose bone
-                pose_bone = context.object.pose.bones.get(edit_bone.name)
-                pose_bone.color.palette = color  # set the pose mode color
-
-                if color == "CUSTOM":
-                    # set edit bone custom colors
-                    edit_bone.color.custom.normal = context.scene.bw_settings.custom_edit_color_set.normal
-                    edit_bone.color.custom.select = context.scene.bw_settings.custom_edit_color_set.select
-                    edit_bone.color.custom.active = context.scene.bw_settings.custom_edit_color_set.active
-                    # set pose bone custom colors
-                    pose_bone.color.custom.normal = context.scene.bw_settings.custom_edit_color_set.normal
-                    pose_bone.color.custom.select = context.scene.bw_settings.custom_edit_color_set.select
-                    pose_bone.color.custom.active = context.scene.bw_settings.custom_edit_color_set.active
-
-            elif get_preferences(context).edit_bone_colors == 'SEPARATE':
-                edit_bone.color.palette = color  # set the edit mode color
-
-                if color == "CUSTOM":
-                    # set edit bone custom colors
-                    edit_bone.color.custom.normal = context.scene.bw_settings.custom_edit_color_set.normal
-                    edit_bone.color.custom.select = context.scene.bw_settings.custom_edit_color_set.select
-                    edit_bone.color.custom.active = context.scene.bw_settings.custom_edit_color_set.active
+                add(edit_bone.color, 'DEFAULT')
+            elif edit_bone_colors == 'LINKED':
+                # set the edit mode and pose mode colors
+                add(edit_bone.color, color, custom_colors)
+                add(pose_bones.get(edit_bone.name).color, color, custom_colors)
+            elif edit_bone_colors == 'SEPARATE':
+                add(edit_bone.color, color, custom_colors)
+
+    return targets
+
+
+def apply_bone_color_targets(targets):
+    """
+    Assigns the collected colors. The values are written without reading the current
+    ones first, comparing them would cost more RNA access than the writes themselves.
+    """
+    count = 0
+    for (palette, custom_colors), bone_colors in targets.items():
+        normal, select, active = custom_colors or (None, None, None)
+        for bone_color in bone_colors:
+            bone_color.palette = palette
+            if custom_colors is not None:
+                custom = bone_color.custom
+                custom.normal = normal
+                custom.select = select
+                custom.active = active
+        count += len(bone_colors)
+    return count
+
+
+def set_bone_color(context, color, clear_both_modes=None):
+    start_time = time.perf_counter()
+
+    count = apply_bone_color_targets(
+        collect_bone_color_targets(context, color, clear_both_modes))
+
+    elapsed = time.perf_counter() - start_time
+    bone_color_stats["bones"] = count
+    bone_color_stats["time"] = elapsed
+    bone_color_stats["time_per_bone"] = elapsed / count if count else 0.0
 
 
 def copy_bone_color(context, bone):
@@ -1,12 +1,44 @@
 import bpy
 import bpy.utils.previews
-from .json_functions import read_widgets, get_widget_data, get_default_image_dir, get_custom_image_dir, JSON_USER_WIDGETS
+from .json_functions import read_widgets, load_widget_data, ensure_widget_data, get_default_image_dir, get_custom_image_dir, get_custom_dir, JSON_USER_WIDGETS
+from .library_functions import atomic_write, load_widget_library
+from .main_functions import build_widget_mesh
+from .thumbnail_functions import (
+    get_required_preview_size,
+    pick_variant_size,
+    get_thumbnail_variant,
+    ThumbnailAtlas,
+    rasterize_widget,
+    write_png,
+)
 import os
+import math
+import json
+import bisect
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
 from .. import __package__
-from mathutils import Vector
+from mathutils import Vector, Euler
+from bpy.app.handlers import persistent
 
 preview_collections = {}
 
+PREVIEW_MANIFEST = "preview_manifest.json"
+PREVIEW_MANIFEST_VERSION = 2
+MISSING_IMAGE = "missing_image.png"
+THUMBNAIL_RESOLUTION = 512
+RENDER_RIG_SCENE = "BoneWidget_Thumbnail"
+CANONICAL_CAMERA = "BoneWidget_Thumbnail_Canonical_Camera"
+VIEW_CAMERA = "BoneWidget_Thumbnail_Camera"
+WIREFRAME_NODE_GROUP = "BONEWIDGET_GeometryGroup"
+PREVIEW_LOAD_BATCH = 64  # thumbnails loaded per draw/timer step in lazy mode
+PREVIEW_LOAD_INTERVAL = 0.05  # seconds between lazy loading steps
+RENDER_PROGRESS_MARKER = "@bonewidget-rendered "  # prefix of the json progress lines of render workers
+
 
 def create_preview_collection():
     if preview_collections:
@@ -17,13 +49,30 @@ def create_preview_collection():
 
     pcoll = bpy.utils.previews.new()
     pcoll.widget_list = ()
+    pcoll.preview_paths = {}
+    pcoll.preview_stats = {}  # (size, mtime) the manifest has for each path
     preview_collections["widgets"] = pcoll
 
+    # smaller copies of the thumbnails, the size depends on how big they are displayed
+    preferences = bpy.context.preferences.addons[__package__].preferences
+    pcoll.variant_size = pick_variant_size(
+        get_required_preview_size()) if preferences.use_thumbnail_variants else None
+    pcoll.atlas = ThumbnailAtlas(pcoll.variant_size) \
+        if preferences.use_thumbnail_atlas and pcoll.variant_size else None
+
+    # lazy previews build the enum from the names on first use and load the icons when drawn
+    if not get_lazy_previews():
+        generate_previews()
+
     bpy.types.WindowManager.widget_list = bpy.props.EnumProperty(
-        items=generate_previews(), name="Shape", description="Shape", update=preview_update
+        items=widget_list_items, name="Shape", description="Shape", update=preview_update
     )
 
 
+def widget_list_items(self, context):
+    return generate_previews()
+
+
 def generate_previews():
     enum_items = []
 
@@ -32,40 +81,148 @@ def generate_previews():
         return pcoll.widget_list
 
     directory = get_default_image_dir('thumbnails')
-    custom_directory = get_custom_image_dir("custom_thumbnails")
 
     if directory and os.path.exists(directory):
-        widget_data = {item[0]: item[1].get(
-            "image", "missing_image.png") for item in read_widgets().items()}
+        # names and images only, the geometry is loaded when a widget is created
+        widget_data = load_widget_data()
         widget_names = sorted(widget_data.keys())
+        pcoll.preview_stats = {}
+        pcoll.preview_paths = resolve_preview_paths(
+            {name: widget_data.image(name) for name in widget_names}, stats=pcoll.preview_stats)
+        load_icons = not get_lazy_previews()
 
         for i, name in enumerate(widget_names):
-            image = widget_data.get(name, "")
-            if image is not None:
-                filepath = os.path.join(directory, image)
+            thumb = pcoll.get(name)
+            if not thumb and load_icons:
+                thumb = load_preview(pcoll, name)
 
-            # try in custom_thumbnails if above failed
-            if not os.path.exists(filepath):
-                filepath = os.path.join(custom_directory, image)
-
-            # if image still not found, let the user know
-            if not os.path.exists(filepath):
-                filepath = os.path.join(directory, "missing_image.png")
-
-            icon = pcoll.get(name)
-            if not icon:
-                thumb = pcoll.load(name, filepath, 'IMAGE')
-            else:
-                thumb = pcoll[name]
-
-            face_data_info = "Contains Face Data" if get_widget_data(
-                name).get("faces") else ""
-            enum_items.append((name, name, face_data_info, thumb.icon_id, i))
+            face_data_info = "Contains Face Data" if widget_data.has_faces(
+                name) else ""
+            enum_items.append((name, name, face_data_info,
+                              thumb.icon_id if thumb else 0, i))
 
     pcoll.widget_list = enum_items
     return enum_items
 
 
+def update_preview_items(updated=(), removed=()):
+    """
+    Adds, replaces or removes single widgets in the preview collection and patches
+    the cached enum items in place, so the other loaded icons are kept.
+    """
+    pcoll = preview_collections.get("widgets")
+    if not pcoll or not pcoll.widget_list:
+        return  # nothing built yet, the next generate_previews picks up the changes
+
+    widget_data = ensure_widget_data()
+    enum_items = pcoll.widget_list
+    names = [item[0] for item in enum_items]
+
+    # drop the old entries, widgets still in the library (e.g. a user widget
+    # replacing a default one) are added back below
+    updated = set(updated)
+    for name in set(removed) | updated:
+        if name in pcoll:
+            del pcoll[name]
+        pcoll.preview_paths.pop(name, None)
+        pcoll.preview_stats.pop(name, None)
+        index = bisect.bisect_left(names, name)
+        if index < len(names) and names[index] == name:
+            del names[index]
+            del enum_items[index]
+        if name in widget_data:
+            updated.add(name)
+
+    updated = sorted(name for name in updated if name in widget_data)
+    if not updated:
+        return
+
+    pcoll.preview_paths.update(resolve_preview_paths(
+        {name: widget_data.image(name) for name in updated}, complete=False, stats=pcoll.preview_stats))
+    load_icons = not get_lazy_previews()
+
+    value = max((item[4] for item in enum_items), default=-1) + 1
+    for name in updated:
+        icon_id = 0
+        if load_icons:
+            icon_id = load_preview(pcoll, name).icon_id
+
+        face_data_info = "Contains Face Data" if widget_data.has_faces(
+            name) else ""
+        index = bisect.bisect_left(names, name)
+        names.insert(index, name)
+        enum_items.insert(index, (name, name, face_data_info, icon_id, value))
+        value += 1
+
+
+def load_preview(pcoll, name):
+    """Loads the thumbnail of a widget from the atlas or the smallest adequate image file."""
+    filepath = pcoll.preview_paths[name]
+    # startup trusts the manifest, files overwritten in place are caught here
+    if get_file_stat(filepath) != pcoll.preview_stats.get(name):
+        filepath = resolve_preview_paths({name: ensure_widget_data().image(name)}, complete=False,
+                                         check_files=True, stats=pcoll.preview_stats)[name]
+        pcoll.preview_paths[name] = filepath
+    if pcoll.atlas is not None:
+        thumb = pcoll.atlas.load_preview(pcoll, name, filepath)
+        if thumb is not None:
+            return thumb
+    # called from draw and enum callbacks, the variant itself is created on a timer
+    return pcoll.load(name, get_thumbnail_variant(filepath, pcoll.variant_size, create=False), 'IMAGE')
+
+
+def load_preview_icons(names=None, limit=None):
+    """
+    Loads the thumbnails of enum items that have no icon yet, names first.
+
+    Returns the number of items still waiting for their icon.
+    """
+    pcoll = preview_collections.get("widgets")
+    if not pcoll or not pcoll.widget_list:
+        return 0
+
+    enum_items = pcoll.widget_list
+    pending = [i for i, item in enumerate(enum_items) if not item[3]]
+    if names:
+        pending.sort(key=lambda i: enum_items[i][0] not in names)
+
+    loaded = 0
+    for i in pending:
+        if limit is not None and loaded >= limit:
+            break
+        name, label, description, icon_id, value = enum_items[i]
+        thumb = pcoll.get(name) or load_preview(pcoll, name)
+        enum_items[i] = (name, label, description, thumb.icon_id, value)
+        loaded += 1
+
+    return len(pending) - loaded
+
+
+def request_preview_icons(active_name=None):
+    """Loads the active thumbnail and a first batch now, the rest in batches from a timer."""
+    if load_preview_icons({active_name}, PREVIEW_LOAD_BATCH) and \
+            not bpy.app.timers.is_registered(load_preview_icons_timer):
+        bpy.app.timers.register(load_preview_icons_timer,
+                                first_interval=PREVIEW_LOAD_INTERVAL)
+
+
+def load_preview_icons_timer():
+    remaining = load_preview_icons(limit=PREVIEW_LOAD_BATCH)
+
+    # redraw so the newly loaded icons show up
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+    return PREVIEW_LOAD_INTERVAL if remaining else None
+
+
+def cancel_preview_icon_loading():
+    if bpy.app.timers.is_registered(load_preview_icons_timer):
+        bpy.app.timers.unregister(load_preview_icons_timer)
+
+
 def preview_update(self, context):
     generate_previews()
 
@@ -74,6 +231,138 @@ def get_preview_default():
     return bpy.context.preferences.addons[__package__].preferences.preview_default
 
 
+def get_lazy_previews():
+    return bpy.context.preferences.addons[__package__].preferences.lazy_previews
+
+
+#### Preview Manifest ####
+def get_preview_manifest_path():
+    return os.path.join(get_custom_dir(), PREVIEW_MANIFEST)
+
+
+def read_preview_manifest():
+    try:
+        with open(get_preview_manifest_path(), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == PREVIEW_MANIFEST_VERSION \
+                and isinstance(manifest.get("directories"), dict) \
+                and isinstance(manifest.get("entries"), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"version": PREVIEW_MANIFEST_VERSION, "directories": {}, "entries": {}}
+
+
+def write_preview_manifest(manifest):
+    try:
+        atomic_write(get_preview_manifest_path(), json.dumps(manifest))
+    except OSError as e:
+        print("Error writing the preview manifest: ", e)
+
+
+def get_directory_mtime(directory):
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_image_directory(directory):
+    """Returns {filename: (size, mtime_ns)} from a single directory listing."""
+    images = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    images[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass
+    return images
+
+
+def get_file_stat(filepath):
+    try:
+        stat = os.stat(filepath)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return 0, 0  # what the manifest records for a missing file
+
+
+def resolve_preview_paths(widget_images, complete=True, check_files=False, stats=None):
+    """
+    Returns {widget name: thumbnail path} for {widget name: image name}.
+
+    Paths are taken from the preview manifest while the thumbnail directories are
+    unchanged, so startup only stats the two directories. Otherwise each directory
+    is listed once and only the entries whose image, location, size or mtime changed
+    are revalidated.
+    Overwriting a file in place doesn't change the directory mtime, pass
+    check_files=True to also compare the files against the manifest (load_preview
+    does that once the recorded size and mtime don't match).
+    Pass complete=False when widget_images only holds some of the widgets and a
+    dictionary as stats to receive the (size, mtime) of each path.
+    """
+    directory = get_default_image_dir('thumbnails')
+    custom_directory = get_custom_image_dir("custom_thumbnails")
+
+    manifest = read_preview_manifest()
+    entries = manifest["entries"]
+
+    directories = {directory: get_directory_mtime(directory),
+                   custom_directory: get_directory_mtime(custom_directory)}
+    directories_changed = manifest["directories"] != directories
+    listings = None
+    changed = directories_changed
+
+    preview_paths = {}
+    for name, image in widget_images.items():
+        image = image or MISSING_IMAGE
+        entry = entries.get(name)
+        if entry and entry["image"] == image and not directories_changed and (
+                not check_files or get_file_stat(entry["path"]) == (entry["size"], entry["mtime"])):
+            preview_paths[name] = entry["path"]
+            if stats is not None:
+                stats[name] = (entry["size"], entry["mtime"])
+            continue
+
+        if listings is None:
+            listings = {d: scan_image_directory(d) for d in directories}
+
+        # thumbnails first, then custom_thumbnails, else let the user know
+        if image in listings[directory]:
+            filepath, stat = os.path.join(directory, image), listings[directory][image]
+        elif image in listings[custom_directory]:
+            filepath, stat = os.path.join(custom_directory, image), listings[custom_directory][image]
+        else:
+            filepath = os.path.join(directory, MISSING_IMAGE)
+            stat = listings[directory].get(MISSING_IMAGE, (0, 0))
+
+        preview_paths[name] = filepath
+        if stats is not None:
+            stats[name] = tuple(stat)
+        if entry and entry["image"] == image and entry["path"] == filepath \
+                and (entry["size"], entry["mtime"]) == tuple(stat):
+            continue
+
+        entries[name] = {"image": image, "path": filepath, "size": stat[0],
+                         "mtime": stat[1]}
+        changed = True
+
+    if complete:
+        for name in set(entries) - set(widget_images):
+            del entries[name]
+            changed = True
+
+    if changed:
+        # the other entries are only known to be valid after a complete pass
+        if complete:
+            manifest["directories"] = directories
+        write_preview_manifest(manifest)
+
+    return preview_paths
+
+
 def copy_custom_image(filepath, filename):
     if os.path.exists(filepath):
         image_directory = get_custom_image_dir('custom_thumbnails')
@@ -120,13 +409,34 @@ def create_wireframe_copy(obj, use_color, color, thickness):
     if not use_color:
         copy.color = color
 
+    add_wireframe_modifier(copy, thickness)
+
+    return copy
+
+
+def add_wireframe_modifier(obj, thickness):
     # Create a new Geometry Nodes modifier
-    geo_mod = copy.modifiers.new(name="BoneWidget_WireFrame", type='NODES')
+    geo_mod = obj.modifiers.new(name="BoneWidget_WireFrame", type='NODES')
+    geo_mod.node_group = get_wireframe_node_group()
+
+    # scale this so it isn't so sensitive
+    geo_mod["Socket_2"] = (thickness / 10)
+
+    return geo_mod
+
 
-    # Create a new node group and assign it to the modifier
+def get_wireframe_node_group():
+    """Returns the wireframe node group, it is only built once and shared by all renders."""
+    node_group = bpy.data.node_groups.get(WIREFRAME_NODE_GROUP)
+    if node_group is None or node_group.bl_idname != 'GeometryNodeTree':
+        node_group = create_wireframe_node_group()
+    return node_group
+
+
+def create_wireframe_node_group():
+    # Create a new node group
     node_group = bpy.data.node_groups.new(
-        name="BONEWIDGET_GeometryGroup", type='GeometryNodeTree')
-    geo_mod.node_group = node_group
+        name=WIREFRAME_NODE_GROUP, type='GeometryNodeTree')
 
     # Add input and output sockets
     node_group.interface.new_socket(
@@ -190,10 +500,7 @@ def create_wireframe_copy(obj, use_color, color, thickness):
     node_group.links.new(
         node_join_geometry.outputs["Geometry"], node_output.inputs["Geometry"])
 
-    # scale this so it isn't so sensitive
-    geo_mod["Socket_2"] = (thickness / 10)
-
-    return copy
+    return node_group
 
 
 def setup_viewport(context):
@@ -233,16 +540,8 @@ def render_widget_thumbnail(image_name, widget_object, image_directory):
 
     destination_path = os.path.join(image_directory, image_name)
 
+    # the render settings come with the render rig scene (see get_render_rig_scene)
     scene = bpy.context.scene
-    scene.render.engine = 'BLENDER_WORKBENCH'
-    scene.render.resolution_x, scene.render.resolution_y = (512, 512)
-    scene.render.resolution_percentage = 100
-    scene.render.image_settings.file_format = 'PNG'
-    scene.render.image_settings.color_mode = 'RGBA'
-    scene.view_settings.view_transform = 'Standard'
-    scene.render.film_transparent = True
-    scene.display.shading.light = 'FLAT'
-    scene.display.shading.color_type = 'OBJECT'
     scene.render.filepath = image_directory
 
     # Reframe Camera
@@ -257,8 +556,20 @@ def render_widget_thumbnail(image_name, widget_object, image_directory):
     return bpy.path.abspath(destination_path)
 
 
+def configure_thumbnail_render(scene, resolution=THUMBNAIL_RESOLUTION):
+    scene.render.engine = 'BLENDER_WORKBENCH'
+    scene.render.resolution_x, scene.render.resolution_y = (resolution, resolution)
+    scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.image_settings.color_mode = 'RGBA'
+    scene.view_settings.view_transform = 'Standard'
+    scene.render.film_transparent = True
+    scene.display.shading.light = 'FLAT'
+    scene.display.shading.color_type = 'OBJECT'
+
+
 def add_camera_from_view(context):
-    name = "BoneWidget_Thumbnail_Camera"
+    name = VIEW_CAMERA
 
     region_3d = context.region_data
     space = context.space_data
@@ -267,25 +578,25 @@ def add_camera_from_view(context):
         print("This must be run from a 3D Viewport.")
         return None
 
-    # Create camera data and object
-    cam_data = bpy.data.cameras.new(name)
-    cam_obj = bpy.data.objects.new(name, cam_data)
-    context.scene.collection.objects.link(cam_obj)
+    # reuse the camera of earlier renders, this makes it the active camera too
+    cam_obj = get_render_rig_camera(context.scene, name)
 
     # Align camera to current viewport
     cam_obj.matrix_world = region_3d.view_matrix.inverted()
 
-    # Make it the active camera
-    context.scene.camera = cam_obj
-
     return cam_obj
 
 
-def frame_object_with_padding(camera, obj, padding=0.1):
-    depsgraph = bpy.context.evaluated_depsgraph_get()
+def frame_object_with_padding(camera, obj, padding=0.1, depsgraph=None):
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        bound_box = obj.bound_box
+    else:
+        # objects in a scene that isn't shown only have bounds once evaluated
+        bound_box = obj.evaluated_get(depsgraph).bound_box
 
     # Get bounding box corners in world space
-    coords = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
+    coords = [obj.matrix_world @ Vector(corner) for corner in bound_box]
 
     # Find center of bounding box
     center = sum(coords, Vector()) / len(coords)
@@ -299,3 +610,319 @@ def frame_object_with_padding(camera, obj, padding=0.1):
     # Use the camera fitting function
     cam_location, _ = camera.camera_fit_coords(depsgraph, flat_coords)
     camera.location = cam_location
+
+
+#### Render Rig ####
+def get_render_rig_scene(resolution=THUMBNAIL_RESOLUTION):
+    """
+    Returns the scene thumbnails are rendered in, it keeps its cameras and render
+    settings between renders so only the widget object changes per render.
+    """
+    scene = bpy.data.scenes.get(RENDER_RIG_SCENE)
+    if scene is None:
+        scene = bpy.data.scenes.new(RENDER_RIG_SCENE)
+        configure_thumbnail_render(scene, resolution)
+    elif scene.render.resolution_x != resolution:
+        configure_thumbnail_render(scene, resolution)
+    return scene
+
+
+def get_render_rig_camera(scene, name):
+    cam_obj = bpy.data.objects.get(name)
+    if cam_obj is None or cam_obj.type != 'CAMERA':
+        cam_obj = bpy.data.objects.new(name, bpy.data.cameras.new(name))
+    if scene.collection.objects.get(name) is None:
+        scene.collection.objects.link(cam_obj)
+    scene.camera = cam_obj
+    return cam_obj
+
+
+def release_render_rig():
+    """Removes the render rig so it doesn't end up in saved files."""
+    scene = bpy.data.scenes.get(RENDER_RIG_SCENE)
+    if scene is not None:
+        bpy.data.scenes.remove(scene)
+
+    for name in (CANONICAL_CAMERA, VIEW_CAMERA):
+        cam_obj = bpy.data.objects.get(name)
+        if cam_obj is not None and cam_obj.type == 'CAMERA':
+            cam_data = cam_obj.data
+            bpy.data.objects.remove(cam_obj, do_unlink=True)
+            if not cam_data.users:
+                bpy.data.cameras.remove(cam_data)
+
+    node_group = bpy.data.node_groups.get(WIREFRAME_NODE_GROUP)
+    if node_group is not None and not node_group.users:
+        bpy.data.node_groups.remove(node_group)
+
+
+@persistent
+def render_rig_save_pre(dummy):
+    release_render_rig()
+
+
+render_rig_handlers = (
+    (bpy.app.handlers.save_pre, render_rig_save_pre),
+)
+
+
+def register_render_rig_handlers():
+    for handler_list, handler in render_rig_handlers:
+        if handler not in handler_list:
+            handler_list.append(handler)
+
+
+def unregister_render_rig_handlers():
+    for handler_list, handler in render_rig_handlers:
+        if handler in handler_list:
+            handler_list.remove(handler)
+    try:
+        release_render_rig()
+    except AttributeError:
+        pass  # bpy.data isn't available while Blender is starting or quitting
+
+
+#### Batch Thumbnail Rendering ####
+def get_library_widgets(widget_names=None, filepath=""):
+    """
+    Returns the widget names to process and a function returning the geometry of a name,
+    read from filepath (a widget .json file) or from the add-on library.
+    """
+    if filepath:
+        wgts = load_widget_library(filepath)
+        widget_source = wgts.get
+    else:
+        wgts = ensure_widget_data()
+        widget_source = wgts.widget_arrays
+
+    if widget_names is None:
+        widget_names = list(wgts)
+    return [name for name in widget_names if name in wgts], widget_source
+
+
+def create_canonical_camera(scene):
+    """Camera looking down the +Y axis (front view), the same angle for every widget."""
+    cam_obj = get_render_rig_camera(scene, CANONICAL_CAMERA)
+    cam_obj.rotation_euler = (math.radians(90), 0, 0)
+    return cam_obj
+
+
+def render_library_thumbnails(widget_names=None, filepath="", output_directory="",
+                              color=(1, 1, 1, 1), thickness=0.5, resolution=THUMBNAIL_RESOLUTION,
+                              report_progress=False):
+    """
+    Renders a thumbnail (<widget name>.png) for library widgets without using a viewport,
+    so it also works in blender --background.
+
+    The widgets are read from filepath (a widget .json file) or from the add-on library,
+    widget_names limits the render to those widgets. Returns the written image paths.
+    With report_progress every finished image is also printed as a RENDER_PROGRESS_MARKER
+    json line, for the process pool to count.
+    """
+    widget_names, widget_source = get_library_widgets(widget_names, filepath)
+
+    if not output_directory:
+        output_directory = get_custom_image_dir('custom_thumbnails')
+    os.makedirs(output_directory, exist_ok=True)
+
+    scene = get_render_rig_scene(resolution)
+    camera = create_canonical_camera(scene)
+    view_layer = scene.view_layers[0]
+
+    written = []
+    for i, name in enumerate(widget_names):
+        mesh = build_widget_mesh(name, widget_source(name), 1.0, (0, 0, 0),
+                                 Euler((0, 0, 0)), use_face_data=False)
+        obj = bpy.data.objects.new(name, mesh)
+        obj.color = color
+        add_wireframe_modifier(obj, thickness)
+        scene.collection.objects.link(obj)
+
+        try:
+            view_layer.update()
+            frame_object_with_padding(
+                camera, obj, padding=0.1, depsgraph=view_layer.depsgraph)
+
+            destination_path = os.path.join(output_directory, name + ".png")
+            bpy.ops.render.render(write_still=False, scene=scene.name)
+            bpy.data.images['Render Result'].save_render(
+                filepath=destination_path, scene=scene)
+            written.append(destination_path)
+            print(f"Rendered thumbnail {i + 1}/{len(widget_names)}: {destination_path}")
+            if report_progress:
+                print(RENDER_PROGRESS_MARKER + json.dumps({"widget": name, "path": destination_path}),
+                      flush=True)
+        except Exception as e:
+            print(f"Error rendering thumbnail for {name}: ", e)
+        finally:
+            # only the widget is swapped, the scene, camera and node group are kept
+            bpy.data.objects.remove(obj, do_unlink=True)
+            bpy.data.meshes.remove(mesh)
+
+    return written
+
+
+def rasterize_library_thumbnails(widget_names=None, filepath="", output_directory="",
+                                 color=(1, 1, 1, 1), resolution=THUMBNAIL_RESOLUTION):
+    """
+    Draws <widget name>.png thumbnails of the widget edges with the numpy rasterizer,
+    no scene, render engine or GPU is needed. Returns the written image paths.
+    """
+    widget_names, widget_source = get_library_widgets(widget_names, filepath)
+
+    if not output_directory:
+        output_directory = get_custom_image_dir('custom_thumbnails')
+    os.makedirs(output_directory, exist_ok=True)
+
+    written = []
+    for name in widget_names:
+        destination_path = os.path.join(output_directory, name + ".png")
+        try:
+            write_png(destination_path, rasterize_widget(widget_source(name), resolution, color))
+            written.append(destination_path)
+        except (OSError, ValueError, IndexError) as e:
+            print(f"Error drawing thumbnail for {name}: ", e)
+
+    return written
+
+
+#### Thumbnail Render Farm ####
+def render_worker_command(job_path):
+    """Command line of a background Blender that renders the widgets listed in job_path."""
+    script = (
+        "import importlib, json\n"
+        f"preview_functions = importlib.import_module({__name__!r})\n"
+        f"with open({job_path!r}) as f:\n"
+        "    job = json.load(f)\n"
+        "preview_functions.render_library_thumbnails(**job)\n"
+    )
+    return [bpy.app.binary_path, "--background", "-noaudio",
+            "--python-exit-code", "1", "--python-expr", script]
+
+
+def _read_worker_output(process, rendered):
+    # workers print one marker line per rendered thumbnail, see render_library_thumbnails
+    for line in process.stdout:
+        if line.startswith(RENDER_PROGRESS_MARKER):
+            try:
+                rendered.put(json.loads(line[len(RENDER_PROGRESS_MARKER):]))
+            except ValueError:
+                pass
+
+
+class ThumbnailRenderPool:
+    """
+    Renders library thumbnails like render_library_thumbnails, split over several
+    background Blender processes (one per core by default), without blocking.
+
+    Each worker renders into its own temporary folder, poll() counts the finished
+    images and finish() moves them into the output directory once all workers are done.
+    """
+
+    def __init__(self, widget_names=None, filepath="", output_directory="", workers=0,
+                 color=(1, 1, 1, 1), thickness=0.5, resolution=THUMBNAIL_RESOLUTION):
+        self.widget_names = get_library_widgets(widget_names, filepath)[0]
+        self.total = len(self.widget_names)
+        self.done = 0
+        self.workers = max(1, min(workers or os.cpu_count() or 1, self.total or 1))
+        self.output_directory = output_directory or get_custom_image_dir('custom_thumbnails')
+        self.job = {"filepath": filepath, "color": list(color), "thickness": thickness,
+                    "resolution": resolution, "report_progress": True}
+        self.work_dir = None
+        self.processes = []
+        self.readers = []
+        self.rendered = queue.Queue()
+
+    def start(self):
+        if not self.widget_names:
+            return
+        os.makedirs(self.output_directory, exist_ok=True)
+        self.work_dir = tempfile.mkdtemp(prefix="bw_render_")
+        try:
+            for i in range(self.workers):
+                shard_dir = os.path.join(self.work_dir, str(i))
+                os.makedirs(shard_dir)
+                job_path = os.path.join(self.work_dir, f"job_{i}.json")
+                with open(job_path, "w") as f:
+                    json.dump(dict(self.job, widget_names=self.widget_names[i::self.workers],
+                                   output_directory=shard_dir), f)
+
+                process = subprocess.Popen(render_worker_command(job_path), stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT, text=True)
+                reader = threading.Thread(target=_read_worker_output, args=(process, self.rendered),
+                                          daemon=True)
+                reader.start()
+                self.processes.append(process)
+                self.readers.append(reader)
+        except Exception:
+            self.cancel()
+            raise
+
+    def poll(self):
+        """Counts the images finished since the last call, returns True while workers are running."""
+        while True:
+            try:
+                self.rendered.get_nowait()
+            except queue.Empty:
+                break
+            self.done += 1
+        return any(reader.is_alive() for reader in self.readers)
+
+    def finish(self):
+        """Waits for the workers, moves their images into the output directory and returns the paths."""
+        written = []
+        try:
+            for process in self.processes:
+                if process.wait():
+                    print("Error: a thumbnail render worker failed with exit code ", process.returncode)
+            for reader in self.readers:
+                reader.join()
+            self.poll()
+
+            # merge the results of all workers
+            for i in range(len(self.processes)):
+                shard_dir = os.path.join(self.work_dir, str(i))
+                for filename in os.listdir(shard_dir):
+                    destination_path = os.path.join(self.output_directory, filename)
+                    # the temporary folder can be on another drive
+                    shutil.move(os.path.join(shard_dir, filename), destination_path)
+                    written.append(destination_path)
+        finally:
+            self.cancel()
+        return written
+
+    def cancel(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+
+def render_thumbnails_in_pool(widget_names=None, filepath="", output_directory="", workers=0,
+                              color=(1, 1, 1, 1), thickness=0.5, resolution=THUMBNAIL_RESOLUTION,
+                              progress=None):
+    """
+    Blocking version of ThumbnailRenderPool, e.g. for blender --background.
+
+    progress is called with (rendered, total) as images finish. Returns the written image paths.
+    """
+    pool = ThumbnailRenderPool(widget_names, filepath, output_directory, workers, color, thickness, resolution)
+    if not pool.total:
+        return []
+
+    pool.start()
+    try:
+        done = 0
+        while pool.poll():
+            if pool.done != done:
+                done = pool.done
+                print(f"Rendered {done}/{pool.total} thumbnails")
+                if progress:
+                    progress(done, pool.total)
+            time.sleep(0.1)
+    except BaseException:
+        pool.cancel()
+        raise
+    return pool.finish()
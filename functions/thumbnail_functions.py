@@ -0,0 +1,487 @@
+import bpy
+import os
+import json
+import zlib
+import struct
+import shutil
+import hashlib
+import numpy
+from .json_functions import get_custom_dir
+from .main_functions import get_preferences
+from .library_functions import widget_to_arrays
+
+THUMBNAIL_CACHE = "thumbnail_cache"
+THUMBNAIL_VARIANT_SIZES = (128, 256)
+ATLAS_COLUMNS = 8  # an atlas page holds ATLAS_COLUMNS x ATLAS_COLUMNS thumbnails
+ATLAS_INDEX = "atlas.json"
+ATLAS_PAGE = "atlas_{:03}.png"
+UI_UNIT = 20  # pixels of one ui unit at a resolution scale of 1.0
+ICON_SIZE = 32
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+VARIANT_BATCH = 8  # variants created per timer call
+VARIANT_INTERVAL = 0.1  # seconds
+RASTER_CHUNK_SIZE = 1 << 18  # sample x pixel pairs the rasterizer evaluates at a time
+pending_variants = {}  # variant path -> (source path, size), created from a timer
+
+
+def get_thumbnail_cache_dir(size):
+    return os.path.join(get_custom_dir(), THUMBNAIL_CACHE, str(size))
+
+
+def get_required_preview_size():
+    """Largest size in pixels the thumbnails are displayed at in the panel or the popup."""
+    preferences = get_preferences(bpy.context)
+    scale = max(preferences.preview_panel_size, preferences.preview_popup_size)
+    return int(scale * UI_UNIT * bpy.context.preferences.system.ui_scale)
+
+
+def pick_variant_size(required_size):
+    """Smallest variant size that is still sharp at required_size, None if only the original is."""
+    for size in THUMBNAIL_VARIANT_SIZES:
+        if size >= required_size:
+            return size
+    return None
+
+
+def _get_mtime(filepath):
+    try:
+        return os.stat(filepath).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_variant_path(source_path, size):
+    # thumbnails and custom_thumbnails can hold images with the same name
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    folder_key = hashlib.sha1(os.path.dirname(os.path.abspath(source_path)).encode()).hexdigest()[:8]
+    return os.path.join(get_thumbnail_cache_dir(size), f"{stem}_{folder_key}.png")
+
+
+def get_thumbnail_variant(source_path, size, create=True):
+    """
+    Returns the path of the size px copy of source_path, creating it when missing or outdated.
+
+    With create=False (draw, enum and register callbacks, where bpy.data can't be
+    written) the source path is returned instead and the variant is queued for a timer.
+    """
+    if size is None:
+        return source_path
+
+    source_mtime = _get_mtime(source_path)
+    if source_mtime is None:
+        return source_path
+
+    variant_path = get_variant_path(source_path, size)
+    variant_mtime = _get_mtime(variant_path)
+    if variant_mtime is not None and variant_mtime >= source_mtime:
+        return variant_path
+
+    if not create:
+        queue_thumbnail_variant(source_path, variant_path, size)
+        return source_path
+
+    return create_thumbnail_variant(source_path, variant_path, size) or source_path
+
+
+def queue_thumbnail_variant(source_path, variant_path, size):
+    pending_variants[variant_path] = (source_path, size)
+    if not bpy.app.timers.is_registered(create_thumbnail_variants_timer):
+        bpy.app.timers.register(create_thumbnail_variants_timer, first_interval=VARIANT_INTERVAL)
+
+
+def create_thumbnail_variants_timer():
+    for _ in range(VARIANT_BATCH):
+        if not pending_variants:
+            break
+        variant_path, (source_path, size) = pending_variants.popitem()
+        create_thumbnail_variant(source_path, variant_path, size)
+    return VARIANT_INTERVAL if pending_variants else None
+
+
+def cancel_thumbnail_variants():
+    pending_variants.clear()
+    if bpy.app.timers.is_registered(create_thumbnail_variants_timer):
+        bpy.app.timers.unregister(create_thumbnail_variants_timer)
+
+
+def downscale_pixels(pixels, size):
+    """Area averages uint8 RGBA rows so the longest side is size px."""
+    height, width = pixels.shape[:2]
+    factor = size / max(width, height)
+    new_height, new_width = max(1, round(height * factor)), max(1, round(width * factor))
+
+    # sum the source rows and columns falling into each target pixel, then divide by their count
+    row_starts = (numpy.arange(new_height) * height) // new_height
+    column_starts = (numpy.arange(new_width) * width) // new_width
+    summed = numpy.add.reduceat(pixels.astype(numpy.uint32), row_starts, axis=0)
+    summed = numpy.add.reduceat(summed, column_starts, axis=1)
+    counts = (numpy.diff(numpy.append(row_starts, height))[:, None]
+              * numpy.diff(numpy.append(column_starts, width))[None, :])
+    return ((summed + counts[..., None] // 2) // counts[..., None]).astype(numpy.uint8)
+
+
+def create_thumbnail_variant(source_path, variant_path, size):
+    try:
+        os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+    except OSError as e:
+        print("Error creating thumbnail variant: ", e)
+        return None
+
+    # thumbnails written by write_png are scaled without any datablocks
+    pixels = read_png(source_path)
+    if pixels is not None:
+        try:
+            if max(pixels.shape[:2]) <= size:
+                shutil.copyfile(source_path, variant_path)
+            else:
+                write_png(variant_path, downscale_pixels(pixels, size))
+            return variant_path
+        except OSError as e:
+            print("Error creating thumbnail variant: ", e)
+            return None
+
+    try:
+        image = bpy.data.images.load(source_path, check_existing=False)
+    except (RuntimeError, AttributeError) as e:
+        print("Error loading thumbnail: ", e)
+        return None
+
+    try:
+        width, height = image.size
+        if max(width, height) <= size:
+            # already small enough, cache it as is so it isn't checked again
+            shutil.copyfile(source_path, variant_path)
+            return variant_path
+
+        factor = size / max(width, height)
+        image.scale(max(1, round(width * factor)), max(1, round(height * factor)))
+        image.filepath_raw = variant_path
+        image.file_format = 'PNG'
+        image.save()
+        return variant_path
+    except (RuntimeError, AttributeError, OSError) as e:
+        print("Error creating thumbnail variant: ", e)
+        return None
+    finally:
+        bpy.data.images.remove(image)
+
+
+def read_image_pixels(filepath):
+    """Returns the pixels of an image as uint8 RGBA rows, top row first."""
+    try:
+        image = bpy.data.images.load(filepath, check_existing=False)
+    except RuntimeError as e:
+        print("Error loading thumbnail: ", e)
+        return None
+
+    try:
+        width, height = image.size
+        pixels = numpy.empty(width * height * 4, dtype=numpy.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(image)
+
+    pixels = (numpy.clip(pixels, 0.0, 1.0) * 255 + 0.5).astype(numpy.uint8)
+    return pixels.reshape(height, width, 4)[::-1]
+
+
+################ PNG ################
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+
+def write_png(filepath, pixels, compression=6):
+    """
+    Writes uint8 RGBA pixels (rows top first) as a PNG file.
+
+    Rows are stored unfiltered, so read_png can decode the file with numpy only.
+    """
+    height, width = pixels.shape[:2]
+    raw = numpy.zeros((height, width * 4 + 1), dtype=numpy.uint8)
+    raw[:, 1:] = pixels.reshape(height, width * 4)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)  # 8 bit RGBA
+    png = PNG_SIGNATURE + _png_chunk(b"IHDR", header) \
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), compression)) \
+        + _png_chunk(b"IEND", b"")
+
+    temp_path = filepath + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(png)
+    os.replace(temp_path, filepath)
+
+
+def read_png(filepath):
+    """
+    Reads a PNG written by write_png into uint8 RGBA rows, top row first.
+
+    Returns None for any other PNG layout (filtered rows, other bit depths, ...).
+    """
+    try:
+        with open(filepath, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+
+    header = None
+    idat = []
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += length + 12
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif tag == b"IDAT":
+            idat.append(body)
+        elif tag == b"IEND":
+            break
+
+    if header is None or header[2:] != (8, 6, 0, 0, 0):
+        return None
+    width, height = header[:2]
+
+    try:
+        raw = numpy.frombuffer(zlib.decompress(b"".join(idat)), dtype=numpy.uint8)
+        raw = raw.reshape(height, width * 4 + 1)
+    except (zlib.error, ValueError):
+        return None
+    if raw[:, 0].any():
+        return None  # filtered rows
+    return raw[:, 1:].reshape(height, width, 4)
+
+
+def validate_png(data):
+    """
+    Checks that bytes hold a complete PNG: chunk crcs, a sane header and a
+    fully inflatable image stream. Safe to call from worker threads.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return False
+
+    header = None
+    inflate = zlib.decompressobj()
+    pos = len(PNG_SIGNATURE)
+    try:
+        while pos + 12 <= len(data):
+            length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+            body = data[pos + 8:pos + 8 + length]
+            crc, = struct.unpack(">I", data[pos + 8 + length:pos + 12 + length] or b"\0\0\0\0")
+            if len(body) != length or zlib.crc32(tag + body) != crc:
+                return False
+            pos += length + 12
+
+            if header is None:
+                if tag != b"IHDR" or length != 13:
+                    return False
+                header = struct.unpack(">IIBBBBB", body)
+                if not header[0] or not header[1]:
+                    return False
+            elif tag == b"IDAT":
+                # the inflated rows are thrown away, only the stream has to be intact
+                inflate.decompress(body)
+            elif tag == b"IEND":
+                return inflate.eof
+    except (struct.error, zlib.error):
+        return False
+    return False
+
+
+################ ATLAS ################
+
+def build_thumbnail_atlas(preview_paths, size):
+    """
+    Packs the size px variants of {widget name: thumbnail path} into atlas pages,
+    so a page of thumbnails is decoded at once instead of one file per widget.
+    """
+    cache_dir = get_thumbnail_cache_dir(size)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cells = ATLAS_COLUMNS * ATLAS_COLUMNS
+    names = sorted(preview_paths)
+    entries = {}
+
+    for page_number, start in enumerate(range(0, len(names), cells)):
+        page = numpy.zeros((ATLAS_COLUMNS * size, ATLAS_COLUMNS * size, 4), dtype=numpy.uint8)
+
+        for cell, name in enumerate(names[start:start + cells]):
+            source_path = preview_paths[name]
+            pixels = read_image_pixels(get_thumbnail_variant(source_path, size))
+            if pixels is None or max(pixels.shape[:2]) > size:
+                continue
+
+            height, width = pixels.shape[:2]
+            row, column = divmod(cell, ATLAS_COLUMNS)
+            page[row * size:row * size + height, column * size:column * size + width] = pixels
+            entries[name] = [page_number, cell, width, height, source_path, _get_mtime(source_path)]
+
+        write_png(os.path.join(cache_dir, ATLAS_PAGE.format(page_number)), page)
+
+    index = {"size": size, "columns": ATLAS_COLUMNS, "entries": entries}
+    with open(os.path.join(cache_dir, ATLAS_INDEX), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+class ThumbnailAtlas:
+    """Loads previews out of the atlas pages of one size, keeping the last used page decoded."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = {}
+        self._page_number = None
+        self._page = None
+
+        try:
+            with open(os.path.join(get_thumbnail_cache_dir(size), ATLAS_INDEX), "r") as f:
+                index = json.load(f)
+            if index.get("size") == size and index.get("columns") == ATLAS_COLUMNS:
+                self.entries = index["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _get_page(self, page_number):
+        if page_number != self._page_number:
+            self._page = read_png(os.path.join(
+                get_thumbnail_cache_dir(self.size), ATLAS_PAGE.format(page_number)))
+            self._page_number = page_number
+        return self._page
+
+    def load_preview(self, pcoll, name, source_path):
+        """Adds the preview of name to pcoll from the atlas, None if the atlas entry is outdated."""
+        entry = self.entries.get(name)
+        if not entry:
+            return None
+        page_number, cell, width, height, atlas_source, source_mtime = entry
+        if atlas_source != source_path or source_mtime != _get_mtime(source_path):
+            return None
+
+        page = self._get_page(page_number)
+        if page is None:
+            return None
+
+        row, column = divmod(cell, ATLAS_COLUMNS)
+        size = self.size
+        pixels = page[row * size:row * size + height, column * size:column * size + width]
+
+        preview = pcoll.new(name)
+        set_preview_pixels(preview, pixels)
+        return preview
+
+
+def set_preview_pixels(preview, pixels):
+    """Fills an ImagePreview and its icon from uint8 RGBA rows (top row first)."""
+    # previews store the bottom row first, one RGBA pixel per int
+    pixels = numpy.ascontiguousarray(pixels[::-1])
+    height, width = pixels.shape[:2]
+    preview.image_size = (width, height)
+    preview.image_pixels.foreach_set(pixels.view(numpy.int32).ravel())
+
+    step = max(1, max(width, height) // ICON_SIZE)
+    icon = numpy.ascontiguousarray(pixels[::step, ::step])
+    preview.icon_size = (icon.shape[1], icon.shape[0])
+    preview.icon_pixels.foreach_set(icon.view(numpy.int32).ravel())
+
+
+################ RASTERIZER ################
+
+# screen axes (right, up) of the orthographic views, front view first
+PROJECTIONS = ((0, 2), (0, 1), (1, 2))
+
+
+def project_widget(vertices, axes=None):
+    """
+    Orthographic projection of the widget vertices to 2D.
+
+    Without axes the view showing the largest area is used, the front view
+    (looking down the +Y axis) when several are equal.
+    """
+    vertices = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 3)
+    if axes is None:
+        extent = numpy.ptp(vertices, axis=0) if len(vertices) else numpy.zeros(3)
+        axes = max(PROJECTIONS, key=lambda a: extent[a[0]] * extent[a[1]])
+    return vertices[:, list(axes)]
+
+
+def fit_to_image(points, resolution, padding=0.1):
+    """Scales and centers 2D points to pixel coordinates, y pointing down."""
+    if not len(points):
+        return points
+    low, high = points.min(axis=0), points.max(axis=0)
+    extent = (high - low).max()
+    scale = resolution * (1 - 2 * padding) / extent if extent > 0 else 1.0
+
+    pixels = (points - (low + high) / 2) * scale + resolution / 2
+    pixels[:, 1] = resolution - pixels[:, 1]
+    return pixels
+
+
+def _cover_samples(coverage, samples, offset_x, offset_y, radius):
+    resolution = coverage.shape[0]
+    base = numpy.floor(samples).astype(numpy.int64)
+    pixel_x = base[:, 0:1] + offset_x
+    pixel_y = base[:, 1:2] + offset_y
+
+    distance = numpy.hypot(pixel_x + 0.5 - samples[:, 0:1], pixel_y + 0.5 - samples[:, 1:2])
+    value = numpy.clip(radius + 0.5 - distance, 0.0, 1.0).astype(numpy.float32)
+
+    inside = (value > 0) & (pixel_x >= 0) & (pixel_x < resolution) \
+        & (pixel_y >= 0) & (pixel_y < resolution)
+    numpy.maximum.at(coverage, (pixel_y[inside], pixel_x[inside]), value[inside])
+
+
+def rasterize_lines(points, edges, resolution, line_width=4.0, color=(1, 1, 1, 1), spacing=0.5):
+    """
+    Draws anti-aliased lines between pixel coordinates into uint8 RGBA rows (top row first).
+
+    Every edge is sampled every spacing pixels and each sample covers the pixels within
+    half the line width, with a one pixel falloff. Overlapping lines keep the highest coverage.
+    """
+    coverage = numpy.zeros((resolution, resolution), dtype=numpy.float32)
+    edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+
+    if len(edges) and len(points):
+        start = points[edges[:, 0]]
+        direction = points[edges[:, 1]] - start
+
+        # sample positions along all edges at once
+        counts = numpy.ceil(numpy.linalg.norm(direction, axis=1) / spacing).astype(numpy.int64) + 1
+        edge_ids = numpy.repeat(numpy.arange(len(edges)), counts)
+        steps = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        factors = steps / numpy.repeat(numpy.maximum(counts - 1, 1), counts)
+        samples = start[edge_ids] + direction[edge_ids] * factors[:, None]
+
+        # pixels around every sample
+        radius = line_width / 2
+        reach = int(numpy.ceil(radius + 1))
+        offset_x, offset_y = numpy.meshgrid(numpy.arange(-reach, reach + 1), numpy.arange(-reach, reach + 1))
+        offset_x, offset_y = offset_x.ravel(), offset_y.ravel()
+
+        # a few samples at a time keeps the (samples x offsets) grids at a bounded size
+        chunk = max(1, RASTER_CHUNK_SIZE // len(offset_x))
+        for first in range(0, len(samples), chunk):
+            _cover_samples(coverage, samples[first:first + chunk], offset_x, offset_y, radius)
+
+    color = numpy.clip(numpy.asarray(color, dtype=numpy.float32), 0.0, 1.0)
+    pixels = numpy.zeros((resolution, resolution, 4), dtype=numpy.uint8)
+    pixels[..., :3] = (color[:3] * 255 + 0.5).astype(numpy.uint8)
+    pixels[..., 3] = (coverage * color[3] * 255 + 0.5).astype(numpy.uint8)
+    return pixels
+
+
+def rasterize_widget(widget, resolution=512, color=(1, 1, 1, 1), line_width=None, axes=None):
+    """Draws the edges of a widget (dictionary or arrays) as uint8 RGBA rows, no render engine involved."""
+    if isinstance(widget, dict):
+        widget = widget_to_arrays(widget)
+    vertices, edges = widget[:2]
+
+    if line_width is None:
+        line_width = resolution / 128
+
+    points = fit_to_image(project_widget(vertices, axes), resolution)
+    return rasterize_lines(points, edges, resolution, line_width, color)
@@ -34,6 +34,8 @@ class BONEWIDGET_MT_bw_color_presets_specials(Menu):
                         icon="ADD", text="Add Preset from Bone")
         layout.operator("bonewidget.add_presets_from_armature",
                         icon="ADD", text="Add Preset from Armature")
+        layout.operator("bonewidget.add_presets_from_armature",
+                        icon="ADD", text="Add Presets from Selected Armatures").all_selected = True
         layout.separator()
         layout.operator("bonewidget.import_color_presets",
                         icon="IMPORT", text="Import Color Presets")
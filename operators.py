@@ -7,6 +7,7 @@ from .functions.main_functions import (
     symmetrize_widget_helper,
     match_bone_matrix,
     create_widget,
+    get_shared_widget_meshes,
     edit_widget,
     return_to_armature,
     get_collection,
@@ -20,21 +21,28 @@ from .functions.main_functions import (
     set_bone_color,
     copy_bone_color,
     get_preferences,
+    register_handlers,
+    unregister_handlers,
 )
 from .functions.json_functions import (
     add_remove_widgets,
     get_widget_data,
+    get_widget_arrays,
+    get_widget_geometry_hash,
     import_widget_library,
     export_widget_library,
     update_custom_image,
     reset_default_images,
     update_widget_library,
+    format_library_import_stats,
+    write_merge_report,
     save_color_sets,
     add_color_set,
     scan_armature_color_presets,
     import_color_presets,
     export_color_presets,
     update_color_presets,
+    ensure_widget_data,
 )
 
 from .functions.preview_functions import (
@@ -44,13 +52,30 @@ from .functions.preview_functions import (
     setup_viewport,
     restore_viewport_position,
     render_widget_thumbnail,
-    add_camera_from_view
+    add_camera_from_view,
+    generate_previews,
+    render_library_thumbnails,
+    render_thumbnails_in_pool,
+    ThumbnailRenderPool,
+    rasterize_library_thumbnails,
+    get_render_rig_scene,
+    resolve_preview_paths,
+    create_preview_collection,
+    register_render_rig_handlers,
+    unregister_render_rig_handlers,
+)
+
+from .functions.thumbnail_functions import (
+    get_required_preview_size,
+    pick_variant_size,
+    build_thumbnail_atlas,
+    THUMBNAIL_VARIANT_SIZES,
 )
 
 from .props import ImportColorSet, ImportItemData, get_import_options
 from .classes import ColorSet
 
-from bpy.props import FloatProperty, BoolProperty, FloatVectorProperty, IntVectorProperty, StringProperty, EnumProperty
+from bpy.props import FloatProperty, BoolProperty, FloatVectorProperty, IntProperty, IntVectorProperty, StringProperty, EnumProperty
 
 
 class BONEWIDGET_OT_shared_property_group(bpy.types.PropertyGroup):
@@ -85,6 +110,13 @@ class BONEWIDGET_OT_create_widget(bpy.types.Operator):
         description="When enabled this option will include the widget's face data (if available)"
     )
 
+    share_mesh_data: BoolProperty(
+        name="Share Mesh Data",
+        default=False,
+        description="Bones getting the same widget with the same settings will share one mesh. "
+                    "Editing a widget gives it its own copy again"
+    )
+
     advanced_options: BoolProperty(
         name="Advanced options",
         default=False,
@@ -148,6 +180,8 @@ class BONEWIDGET_OT_create_widget(bpy.types.Operator):
         row = col.row(align=True)
         if self.advanced_options:
             row.prop(self, "use_face_data")
+            row = col.row(align=True)
+            row.prop(self, "share_mesh_data")
         row = col.row(align=True)
         row.prop(
             self, "global_size_advanced" if self.advanced_options else "global_size_simple", expand=False)
@@ -163,15 +197,22 @@ class BONEWIDGET_OT_create_widget(bpy.types.Operator):
         row.prop(self, "advanced_options")
 
     def execute(self, context):
-        widget_data = get_widget_data(context.window_manager.widget_list)
+        # converted once and shared by all the bones
+        widget_name = context.window_manager.widget_list
+        widget_arrays = get_widget_arrays(widget_name)
         slide = self.slide_advanced if self.advanced_options else (
             0.0, self.slide_simple, 0.0)
         global_size = self.global_size_advanced if self.advanced_options else (
             self.global_size_simple,) * 3
         use_face_data = self.use_face_data if self.advanced_options else False
+        collection = get_collection(context)
+        share_mesh_data = self.share_mesh_data if self.advanced_options else False
+        shared_meshes = get_shared_widget_meshes() if share_mesh_data else None
+        widget_geometry = get_widget_geometry_hash(widget_name) if share_mesh_data else None
         for bone in bpy.context.selected_pose_bones:
-            create_widget(bone, widget_data, self.relative_size, global_size, slide, self.rotation,
-                          get_collection(context), use_face_data, self.wireframe_width)
+            create_widget(bone, widget_arrays, self.relative_size, global_size, slide, self.rotation,
+                          collection, use_face_data, self.wireframe_width, widget_name, shared_meshes,
+                          widget_geometry)
         return {'FINISHED'}
 
 
@@ -463,7 +504,7 @@ class BONEWIDGET_OT_add_widgets(bpy.types.Operator):
             custom_image_path = os.path.abspath(os.path.join(
                 os.path.dirname(__file__), '..', 'custom_thumbnails'))
 
-        message_type, return_message = add_remove_widgets(context, "add", bpy.types.WindowManager.widget_list.keywords['items'],
+        message_type, return_message = add_remove_widgets(context, "add", generate_previews(),
                                                           objects, self.widget_name, custom_image_name)
 
         if return_message:
@@ -485,7 +526,7 @@ class BONEWIDGET_OT_remove_widgets(bpy.types.Operator):
         remove_custom_image(get_widget_data(objects).get("image"))
 
         message_type, return_message = add_remove_widgets(
-            context, "remove", bpy.types.WindowManager.widget_list.keywords['items'], objects)
+            context, "remove", generate_previews(), objects)
 
         if return_message:
             self.report({message_type}, return_message)
@@ -523,6 +564,23 @@ class BONEWIDGET_OT_import_items_summary_popup(bpy.types.Operator):
             row.label(
                 text=f"Failed Items: {context.window_manager.custom_data.failed()}")
 
+            duplicates = len(context.window_manager.custom_data.duplicate_imports)
+            if duplicates:
+                row = layout.row()
+                row.label(text=f"Same Shape as a Library Widget: {duplicates}")
+
+            if context.window_manager.custom_data.import_type == "widget":
+                layout.separator()
+                row = layout.row()
+                row.label(text=format_library_import_stats())
+
+            change_report = context.window_manager.custom_data.change_report
+            if change_report:
+                layout.separator()
+                for change, count in sorted(change_report["summary"].items()):
+                    row = layout.row()
+                    row.label(text=f"{change.replace('_', ' ').capitalize()}: {count}")
+
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self)
 
@@ -530,26 +588,129 @@ class BONEWIDGET_OT_import_items_summary_popup(bpy.types.Operator):
         return {'FINISHED'}
 
 
-def update_selected_options(self, context):
-    wm = context.window_manager
+ASK_PAGE_SIZE = 20  # rows the ask popup materializes at a time
+
 
-    selected_values = []
+def get_matching_indices(context, filter_text):
+    """Returns the indices of the skipped imports whose name contains the filter text."""
+    items = context.window_manager.custom_data.skipped_imports
+    filter_text = filter_text.strip().lower()
+    if not filter_text:
+        return list(range(len(items)))
+    return [i for i, item in enumerate(items) if filter_text in item.name.lower()]
 
-    items = wm.prop_grp.import_item_data
-    for i, item in enumerate(items):
-        if self.select_all_items:
-            selected_values.append(item.import_option)
-            if item.import_option != "RENAME":
-                item.import_option = "OVERWRITE"
-        else:
-            if i < len(BONEWIDGET_OT_import_items_ask_popup.selected_options_values):
-                value = BONEWIDGET_OT_import_items_ask_popup.selected_options_values[i]
-                if value != "RENAME":
-                    item.import_option = value
+
+def store_ask_page(context):
+    """Writes the choices made on the visible rows back to the state of all items."""
+    popup = BONEWIDGET_OT_import_items_ask_popup
+    prop_grp = context.window_manager.prop_grp
+
+    for row, index in enumerate(popup.page_indices):
+        if row >= len(prop_grp.import_item_data):
+            break
+        imported_item = prop_grp.import_item_data[row]
+        state = popup.item_states[index]
+        state["name"] = imported_item.name
+        state["import_option"] = imported_item.import_option
+
+        if row < len(prop_grp.color_sets):
+            color_set = prop_grp.color_sets[row]
+            state["colors"] = (tuple(color_set.normal), tuple(color_set.select), tuple(color_set.active))
+
+
+def build_ask_page(context, page):
+    """Fills the shared property group with the rows of one page, returns the page shown."""
+    popup = BONEWIDGET_OT_import_items_ask_popup
+    prop_grp = context.window_manager.prop_grp
+    import_data = context.window_manager.custom_data
+
+    page_count = max(1, -(-len(popup.matching_indices) // ASK_PAGE_SIZE))
+    page = min(max(page, 1), page_count)
+    start = (page - 1) * ASK_PAGE_SIZE
+    popup.page_indices = popup.matching_indices[start:start + ASK_PAGE_SIZE]
+    popup.page_count = page_count
+    popup.current_page = page
+
+    prop_grp.import_item_data.clear()
+    prop_grp.color_sets.clear()
+
+    for index in popup.page_indices:
+        item = import_data.skipped_imports[index]
+        state = popup.item_states[index]
+
+        import_item = prop_grp.import_item_data.add()
+        import_item.name = state["name"]
+        import_item.import_option = state["import_option"]
+
+        # add the color fields if the import is a color set
+        if import_data.import_type == "colorset":
+            color_instance = prop_grp.color_sets.add()
+            color_instance.name = item.name
+            color_instance.normal, color_instance.select, color_instance.active = state["colors"]
+
+        # widget preview images, only for the visible rows
+        elif import_data.import_type == "widget" and item.name not in prop_grp.image_collection:
+            image_path = os.path.join(import_data.thumbnail_dir or "", item.image)
+            prop_grp.image_collection.load(item.name, image_path, 'IMAGE')
+
+    return page
+
+
+def update_ask_page(self, context):
+    if self.page == BONEWIDGET_OT_import_items_ask_popup.current_page:
+        return
+    store_ask_page(context)
+    page = build_ask_page(context, self.page)
+    if page != self.page:
+        self.page = page  # clamped to the last page
+
+
+def update_ask_filter(self, context):
+    popup = BONEWIDGET_OT_import_items_ask_popup
+    store_ask_page(context)
+    popup.matching_indices = get_matching_indices(context, self.filter_text)
+    popup.page_indices = []  # the visible rows are stored already
+    popup.current_page = None
+    if self.page != 1:
+        self.page = 1
+    else:
+        build_ask_page(context, 1)
+
+
+def apply_to_matching_items(self, context):
+    if self.apply_to_matching == "NONE":
+        return
+    popup = BONEWIDGET_OT_import_items_ask_popup
+
+    store_ask_page(context)
+    for index in popup.matching_indices:
+        state = popup.item_states[index]
+        if state["import_option"] != "RENAME":  # keep items the user renamed
+            state["import_option"] = self.apply_to_matching
+    build_ask_page(context, popup.current_page)
+
+    self.apply_to_matching = "NONE"
+
+
+def update_selected_options(self, context):
+    popup = BONEWIDGET_OT_import_items_ask_popup
+    store_ask_page(context)
 
     if self.select_all_items:
         # reset and store only once
-        BONEWIDGET_OT_import_items_ask_popup.selected_options_values = selected_values
+        popup.selected_options_values = {}
+        for index in popup.matching_indices:
+            state = popup.item_states[index]
+            popup.selected_options_values[index] = state["import_option"]
+            if state["import_option"] != "RENAME":
+                state["import_option"] = "OVERWRITE"
+    else:
+        for index, value in popup.selected_options_values.items():
+            state = popup.item_states[index]
+            if value != "RENAME" and state["import_option"] != "RENAME":
+                state["import_option"] = value
+
+    build_ask_page(context, popup.current_page)
 
 
 class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
@@ -560,10 +721,35 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
 
     import_options = get_import_options()
 
-    select_all_items: BoolProperty(name="Select All", description="Will select all items to be added",
-                                   default=False, update=update_selected_options)
+    select_all_items: BoolProperty(name="Select All", description="Will select all matching items to be added",
+                                   default=False, update=update_selected_options, options={'SKIP_SAVE'})
+
+    filter_text: StringProperty(name="Filter", description="Only show items whose name contains this text",
+                                default="", update=update_ask_filter, options={'SKIP_SAVE'})
 
-    selected_options_values = []
+    page: IntProperty(name="Page", description="Page of items to show",
+                      default=1, min=1, update=update_ask_page, options={'SKIP_SAVE'})
+
+    apply_to_matching: EnumProperty(
+        name="Apply to Matching",
+        description="Set the action of every item matching the filter, renamed items are kept",
+        items=[
+            ("NONE", "Apply to Matching", "Choose an action for all matching items"),
+            ("OVERWRITE", "Add/Overwrite All", "Add or Overwrite all matching items"),
+            ("SKIP", "Skip All", "Skip all matching items")],
+        default="NONE",
+        update=apply_to_matching_items,
+        options={'SKIP_SAVE'},
+    )
+
+    # index of the skipped import -> previous option, to undo select all
+    selected_options_values = {}
+    # choices of every skipped import, only the visible page lives in the property group
+    item_states = []
+    matching_indices = []
+    page_indices = []
+    page_count = 1
+    current_page = None
 
     def draw(self, context):
         layout = self.layout
@@ -572,12 +758,16 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
         # layout.separator()
         row = layout.row()
         row.label(text="Choose an action:")
+        row = layout.row()
+        row.prop(self, "filter_text", text="", icon='VIEWZOOM')
 
         imported_items = context.window_manager.prop_grp.import_item_data
 
-        for i, _ in enumerate(self.custom_import_data.skipped_imports):
+        for row_index, index in enumerate(self.page_indices):
+            if row_index >= len(imported_items):
+                break
 
-            imported_item = imported_items[i]
+            imported_item = imported_items[row_index]
 
             if self.custom_import_data.import_type == "widget":
                 row = layout.row(align=True)
@@ -589,7 +779,7 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
                 else:
                     row.label(text=str(imported_item.name))
 
-                widget_name = self.custom_import_data.skipped_imports[i].name
+                widget_name = self.custom_import_data.skipped_imports[index].name
                 icon_id = context.window_manager.prop_grp.image_collection[widget_name].icon_id
                 icon_row = row.row(align=True)
                 icon_row.scale_x = 6
@@ -611,7 +801,7 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
                 row.separator(factor=0.4)
 
                 # color sets
-                color_set = context.window_manager.prop_grp.color_sets[i]
+                color_set = context.window_manager.prop_grp.color_sets[row_index]
                 split = row.split(factor=0.9)
                 color_row = split.row(align=True)
                 color_row.prop(color_set, "normal", text="")
@@ -622,47 +812,45 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
                 row.separator(factor=0.4)
                 row.prop(imported_item, "import_option", text="")
 
+        if not self.page_indices:
+            row = layout.row()
+            row.label(text="No matching items")
+
         row = layout.row()
         row = layout.row()
-        row = layout.row()
+        row.prop(self, "page")
+        row.label(text=f"of {self.page_count}  ({len(self.matching_indices)} items)")
 
+        row = layout.row()
         row.prop(self, "select_all_items")
+        row.prop(self, "apply_to_matching", text="")
 
         layout.separator()
 
     def invoke(self, context, event):
+        cls = BONEWIDGET_OT_import_items_ask_popup
         self.custom_import_data = bpy.context.window_manager.custom_data
         import_type = self.custom_import_data.import_type
 
         # make sure class values are empty
-        BONEWIDGET_OT_import_items_ask_popup.selected_options_values = []
+        cls.selected_options_values = {}
 
         # make sure the shared property group has a clean slate
         context.window_manager.prop_grp.color_sets.clear()
         context.window_manager.prop_grp.import_item_data.clear()
         context.window_manager.prop_grp.image_collection.clear()
 
-        # generate the x number of drop down lists and widget names needed
-        for n, widget in enumerate(self.custom_import_data.skipped_imports):
-
-            # add new imported item
-            import_item = context.window_manager.prop_grp.import_item_data.add()
-            import_item.name = widget.name
-
-            # add the color fields if the import is a color set
+        # keep the choices as plain data, rows are only created for the visible page
+        cls.item_states = []
+        for widget in self.custom_import_data.skipped_imports:
+            state = {"name": widget.name, "import_option": "SKIP"}
             if import_type == "colorset":
-                color_instance = context.window_manager.prop_grp.color_sets.add()
-                color_instance.name = widget.name
-                color_instance.normal = widget.normal
-                color_instance.select = widget.select
-                color_instance.active = widget.active
+                state["colors"] = (tuple(widget.normal), tuple(widget.select), tuple(widget.active))
+            cls.item_states.append(state)
 
-            # widget preview images
-            if import_type == "widget":
-                image_path = os.path.join(
-                    bpy.app.tempdir, "custom_thumbnails", widget.image)
-                context.window_manager.prop_grp.image_collection.load(
-                    widget.name, image_path, 'IMAGE')
+        cls.matching_indices = list(range(len(cls.item_states)))
+        cls.page_indices = []
+        build_ask_page(context, 1)
 
         return context.window_manager.invoke_props_dialog(self, width=350)
 
@@ -670,21 +858,23 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
         widget_results = {}
         widget_images = set()
         import_type = self.custom_import_data.import_type
-        total_imports = len(self.custom_import_data.skipped_imports)
+
+        # the visible rows hold the latest choices
+        store_ask_page(context)
 
         for i, widget in enumerate(self.custom_import_data.skipped_imports[:]):
-            imported_item = context.window_manager.prop_grp.import_item_data[i]
+            state = self.item_states[i]
 
-            action = imported_item.import_option
+            action = state["import_option"]
 
             if action == self.import_options[1][0]:  # skip
                 continue
 
-            new_widget_name = imported_item.name
+            new_widget_name = state["name"]
 
             # error check before proceeding - widget renamed to empty string
             if widget.name != new_widget_name and new_widget_name.strip() == "":
-                self.custom_import_data.failed_imports.update(widget)
+                self.custom_import_data.failed_imports.append(widget)
                 continue
 
             if import_type == "widget":
@@ -694,9 +884,9 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
                 widget_image = widget_image if widget_image != "user_defined.png" else ""
 
             elif import_type == "colorset":
-                widget_data = context.window_manager.prop_grp.color_sets[i]
-                widget_data = ColorSet.from_pg(
-                    widget_data)  # convert to ColorSet class
+                normal, select, active = state["colors"]
+                widget_data = ColorSet({"name": widget.name, "normal": normal,
+                                        "select": select, "active": active})
 
             if action == self.import_options[0][0]:  # overwrite
                 if import_type == "widget":
@@ -734,7 +924,8 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
 
         if import_type == "widget":
             update_widget_library(widget_results, widget_images,
-                                  bpy.context.window_manager.prop_grp.import_library_filepath)
+                                  bpy.context.window_manager.prop_grp.import_library_filepath,
+                                  self.custom_import_data.thumbnail_dir, self.custom_import_data.delta)
 
         # clear image collection if widgets were imported
         context.window_manager.prop_grp.image_collection.clear()
@@ -748,8 +939,11 @@ class BONEWIDGET_OT_import_items_ask_popup(bpy.types.Operator):
         # del bpy.types.WindowManager.custom_data
         self.custom_import_data = None
 
-        # reset previous selected options
-        BONEWIDGET_OT_import_items_ask_popup.selected_options_values = []
+        # reset previous selected options and the item states
+        BONEWIDGET_OT_import_items_ask_popup.selected_options_values = {}
+        BONEWIDGET_OT_import_items_ask_popup.item_states = []
+        BONEWIDGET_OT_import_items_ask_popup.matching_indices = []
+        BONEWIDGET_OT_import_items_ask_popup.page_indices = []
 
         # display summary of imported widgets
         bpy.ops.bonewidget.import_summary_popup('INVOKE_DEFAULT')
@@ -783,7 +977,8 @@ class BONEWIDGET_OT_import_widget_library(bpy.types.Operator):
         items=[
             ("OVERWRITE", "Overwrite", "Overwrite existing widget"),
             ("SKIP", "Skip", "Skip widget"),
-            ("ASK", "Ask", "Ask user what to do")],
+            ("ASK", "Ask", "Ask user what to do"),
+            ("MERGE", "Merge", "Only import new and changed widgets, keep widgets changed locally since the last merge")],
         default="ASK",
     )
 
@@ -806,12 +1001,20 @@ class BONEWIDGET_OT_import_widget_library(bpy.types.Operator):
             # if the number of failed widgets are equal to total imported widgets - call summary popup
             if import_library_data.failed() == import_library_data.total() or import_library_data.failed() == -1:
                 import_library_data.reset_imports()
+                if import_library_data.delta is not None:
+                    if import_library_data.total() == 0:
+                        # a delta can consist of removed widgets only
+                        update_widget_library({}, set(), self.filepath, None, import_library_data.delta)
+                    else:
+                        # nothing in it validated, don't apply its removals on their own either
+                        self.report({'WARNING'}, "No widget of the delta library could be imported, "
+                                    "its removals were not applied!")
                 bpy.ops.bonewidget.import_summary_popup('INVOKE_DEFAULT')
 
             elif self.import_option == "ASK":
                 bpy.ops.bonewidget.import_items_ask_popup('INVOKE_DEFAULT')
 
-            elif self.import_option in ["OVERWRITE", "SKIP"]:
+            elif self.import_option in ["OVERWRITE", "SKIP", "MERGE"]:
                 widget_images = set()
                 widgets = {}
 
@@ -820,7 +1023,12 @@ class BONEWIDGET_OT_import_widget_library(bpy.types.Operator):
                     widgets.update(widget.to_dict())
                     widget_images.add(widget.image)
 
-                update_widget_library(widgets, widget_images, self.filepath)
+                update_widget_library(widgets, widget_images, self.filepath,
+                                      import_library_data.thumbnail_dir, import_library_data.delta)
+
+                # only a merge that made it into the library becomes the base of the next one
+                if import_library_data.change_report:
+                    write_merge_report(import_library_data.change_report)
 
                 bpy.ops.bonewidget.import_summary_popup('INVOKE_DEFAULT')
 
@@ -856,10 +1064,19 @@ class BONEWIDGET_OT_export_widget_library(bpy.types.Operator):
         subtype="FILE_PATH"
     )
 
+    delta: BoolProperty(
+        name="Only Changes",
+        description="Only export widgets added or changed since the last export, and the names of removed ones",
+        default=False,
+    )
+
     def execute(self, context):
         if self.filepath and self.filename:
-            num_widgets = export_widget_library(self.filepath)
-            if num_widgets:
+            num_widgets, num_removed = export_widget_library(self.filepath, self.delta)
+            if num_removed:
+                self.report(
+                    {'INFO'}, f"{num_widgets} user defined widgets and {num_removed} removals exported successfully!")
+            elif num_widgets:
                 self.report(
                     {'INFO'}, f"{num_widgets} user defined widgets exported successfully!")
             else:
@@ -907,12 +1124,28 @@ class BONEWIDGET_OT_delete_unused_widgets(bpy.types.Operator):
     def poll(cls, context):
         return (context.object and context.object.type == 'ARMATURE' and context.object.mode == 'POSE')
 
+    dry_run: BoolProperty(
+        name="Dry Run",
+        default=False,
+        description="Only report the widgets that would be deleted"
+    )
+
     def execute(self, context):
         try:
-            delete_unused_widgets()
+            unused_widgets, scan_time = delete_unused_widgets(self.dry_run)
         except:
             self.report(
                 {'INFO'}, "Can't find the Widget Collection. Does it exist?")
+            return {'FINISHED'}
+
+        if self.dry_run:
+            for name in unused_widgets:
+                print("Unused widget: ", name)
+            self.report({'INFO'}, f"{len(unused_widgets)} unused widgets would be deleted "
+                                  f"(scan took {scan_time * 1000:.1f} ms)")
+        else:
+            self.report({'INFO'}, f"{len(unused_widgets)} unused widgets deleted "
+                                  f"(scan took {scan_time * 1000:.1f} ms)")
         return {'FINISHED'}
 
 
@@ -1318,10 +1551,20 @@ class BONEWIDGET_OT_add_presets_from_armature(bpy.types.Operator):
             )
         )
 
+    all_selected: BoolProperty(
+        name="All Selected Armatures",
+        description="Scan every selected armature instead of only the active one",
+        default=False
+    )
+
     def execute(self, context):
-        armature = context.object.data
+        armature_objects = [context.object]
+        if self.all_selected:
+            armature_objects += [obj for obj in context.selected_objects
+                                 if obj.type == 'ARMATURE' and obj != context.object]
 
-        colorset_imports = scan_armature_color_presets(context, armature)
+        colorset_imports = scan_armature_color_presets(
+            context, armature_objects)
 
         if colorset_imports.skipped_imports:
             bpy.types.WindowManager.custom_data = colorset_imports
@@ -1517,9 +1760,9 @@ class BONEWIDGET_OT_render_widget_thumbnail(bpy.types.Operator):
         original_view_perspective = context.space_data.region_3d.view_perspective
 
         original_scene = context.scene
-        new_scene = bpy.data.scenes.new("BoneWidget_Thumbnail")
-        new_scene.collection.objects.link(widget_obj)
-        context.window.scene = new_scene
+        render_scene = get_render_rig_scene()
+        render_scene.collection.objects.link(widget_obj)
+        context.window.scene = render_scene
 
         viewport_area = next(
             (a for a in context.window.screen.areas if a.type == 'VIEW_3D'), None)
@@ -1528,7 +1771,7 @@ class BONEWIDGET_OT_render_widget_thumbnail(bpy.types.Operator):
             return {'CANCELLED'}
 
         original_view_matrix = setup_viewport(context)
-        new_camera = add_camera_from_view(context)
+        add_camera_from_view(context)
 
         destination_path = render_widget_thumbnail(
             self.image_name, widget_obj, image_directory=self.use_blend_path)
@@ -1538,25 +1781,184 @@ class BONEWIDGET_OT_render_widget_thumbnail(bpy.types.Operator):
 
         context.window.scene = original_scene
 
-        # Clean up (widget and camera objs and data)
+        # Clean up the widget, the render scene and camera are kept for the next render
         widget_data = widget_obj.data
-        camera_data = new_camera.data
 
         bpy.data.objects.remove(widget_obj, do_unlink=True)
         bpy.data.meshes.remove(widget_data)
 
-        bpy.data.objects.remove(new_camera, do_unlink=True)
-        bpy.data.cameras.remove(camera_data)
-
-        # Remove Scene
-        bpy.data.scenes.remove(new_scene)
-
         if self.use_blend_path:
             self.report({'INFO'}, "Thumbnail saved at: " + destination_path)
 
         return {'FINISHED'}
 
 
+class BONEWIDGET_OT_render_library_thumbnails(bpy.types.Operator):
+    """Render thumbnails for the widgets of a library without using the viewport"""
+    bl_idname = "bonewidget.render_library_thumbnails"
+    bl_label = "Render Library Thumbnails"
+    bl_options = {'REGISTER'}
+
+    filepath: StringProperty(
+        name="Library File",
+        description="Widget .json file to render, leave empty for the add-on library",
+        subtype="FILE_PATH",
+        default=""
+    )
+    widget_names: StringProperty(
+        name="Widget Names",
+        description="Comma separated widget names to render, leave empty for all widgets",
+        default=""
+    )
+    directory: StringProperty(
+        name="Output Directory",
+        description="Where the images are written, leave empty for the custom thumbnails folder",
+        subtype="DIR_PATH",
+        default=""
+    )
+    wire_frame_color: FloatVectorProperty(
+        name="Wireframe Color",
+        subtype='COLOR',
+        size=4,
+        default=(1, 1, 1, 1),
+        min=0.0,
+        max=1.0
+    )
+    wire_frame_thickness: FloatProperty(
+        name="Wireframe Thickness",
+        default=0.5,
+        min=0.01,
+        max=2.0
+    )
+    resolution: IntProperty(
+        name="Resolution",
+        default=512,
+        min=16,
+        max=4096
+    )
+    method: EnumProperty(
+        name="Method",
+        items=[
+            ('RENDER', "Render", "Render the wireframe with Workbench"),
+            ('RASTERIZE', "Rasterize", "Draw the edges directly, much faster and needs no render engine"),
+        ],
+        default='RENDER'
+    )
+    workers: IntProperty(
+        name="Worker Processes",
+        description="Render in this many background Blender processes, 0 uses one per core",
+        default=1,
+        min=0,
+        max=256
+    )
+
+    def execute(self, context):
+        widget_names = [name.strip() for name in self.widget_names.split(",") if name.strip()] or None
+
+        if self.method == 'RASTERIZE':
+            written = rasterize_library_thumbnails(
+                widget_names,
+                bpy.path.abspath(self.filepath),
+                bpy.path.abspath(self.directory),
+                self.wire_frame_color,
+                self.resolution
+            )
+        elif self.workers == 1:
+            written = render_library_thumbnails(
+                widget_names,
+                bpy.path.abspath(self.filepath),
+                bpy.path.abspath(self.directory),
+                self.wire_frame_color,
+                self.wire_frame_thickness,
+                self.resolution
+            )
+        elif bpy.app.background:
+            # no event loop to wait in, block until the workers are done
+            written = render_thumbnails_in_pool(
+                widget_names,
+                bpy.path.abspath(self.filepath),
+                bpy.path.abspath(self.directory),
+                self.workers,
+                self.wire_frame_color,
+                self.wire_frame_thickness,
+                self.resolution
+            )
+        else:
+            return self.start_pool(context, widget_names)
+
+        self.report({'INFO'}, f"Rendered {len(written)} thumbnails")
+        return {'FINISHED'}
+
+    def start_pool(self, context, widget_names):
+        """Starts the worker processes and keeps Blender responsive while they render."""
+        self._pool = ThumbnailRenderPool(
+            widget_names,
+            bpy.path.abspath(self.filepath),
+            bpy.path.abspath(self.directory),
+            self.workers,
+            self.wire_frame_color,
+            self.wire_frame_thickness,
+            self.resolution
+        )
+        if not self._pool.total:
+            self.report({'INFO'}, "Rendered 0 thumbnails")
+            return {'FINISHED'}
+        self._pool.start()
+
+        wm = context.window_manager
+        wm.progress_begin(0, self._pool.total)
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        wm = context.window_manager
+        if event.type == 'ESC':
+            self.stop_pool(context)
+            self._pool.cancel()
+            self.report({'WARNING'}, "Thumbnail rendering cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER' or event.timer != self._timer:
+            return {'PASS_THROUGH'}
+
+        running = self._pool.poll()
+        wm.progress_update(self._pool.done)
+        if running:
+            return {'PASS_THROUGH'}
+
+        self.stop_pool(context)
+        written = self._pool.finish()
+        self.report({'INFO'}, f"Rendered {len(written)} thumbnails")
+        return {'FINISHED'}
+
+    def stop_pool(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+
+
+class BONEWIDGET_OT_build_thumbnail_atlas(bpy.types.Operator):
+    """Pack downscaled copies of all thumbnails into atlas pages that load faster"""
+    bl_idname = "bonewidget.build_thumbnail_atlas"
+    bl_label = "Rebuild Thumbnail Atlas"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        size = pick_variant_size(get_required_preview_size()) or THUMBNAIL_VARIANT_SIZES[-1]
+
+        widget_data = ensure_widget_data()
+        preview_paths = resolve_preview_paths(
+            {name: widget_data.image(name) for name in widget_data})
+        index = build_thumbnail_atlas(preview_paths, size)
+
+        # reload the previews from the new atlas
+        create_preview_collection()
+
+        self.report({'INFO'}, f"Packed {len(index['entries'])} thumbnails at {size} px")
+        return {'FINISHED'}
+
+
 classes = (
     BONEWIDGET_OT_remove_widgets,
     BONEWIDGET_OT_add_widgets,
@@ -1594,6 +1996,8 @@ classes = (
     BONEWIDGET_OT_import_color_presets,
     BONEWIDGET_OT_export_color_presets,
     BONEWIDGET_OT_render_widget_thumbnail,
+    BONEWIDGET_OT_render_library_thumbnails,
+    BONEWIDGET_OT_build_thumbnail_atlas,
 )
 
 
@@ -1608,8 +2012,14 @@ def register():
     bpy.types.WindowManager.prop_grp = bpy.props.PointerProperty(
         type=BONEWIDGET_OT_shared_property_group)
 
+    register_handlers()
+    register_render_rig_handlers()
+
 
 def unregister():
+    unregister_handlers()
+    unregister_render_rig_handlers()
+
     del bpy.types.WindowManager.prop_grp
 
     from bpy.utils import unregister_class
@@ -9,8 +9,11 @@ from .functions.preview_functions import (
     create_preview_collection,
     preview_collections,
     get_preview_default,
+    request_preview_icons,
+    cancel_preview_icon_loading,
 )
 from .functions.json_functions import load_color_presets
+from .functions.thumbnail_functions import cancel_thumbnail_variants
 
 from .menus import BONEWIDGET_MT_bw_specials
 
@@ -43,6 +46,9 @@ class BONEWIDGET_PT_bw_panel_main(BONEWIDGET_PT_bw_panel, bpy.types.Panel):
 
         # preview view
         if context.window_manager.toggle_preview:
+            # load thumbnails not loaded yet (lazy previews)
+            request_preview_icons(context.window_manager.widget_list)
+
             row = layout.row(align=True)
             preview_panel_size = preferences.preview_panel_size
             preview_popup_size = preferences.preview_popup_size
@@ -268,6 +274,8 @@ def unregister():
 
     bpy.utils.unregister_class(PresetColorSetItem)
 
+    cancel_preview_icon_loading()
+    cancel_thumbnail_variants()
     for pcoll in preview_collections.values():
         bpy.utils.previews.remove(pcoll)
     preview_collections.clear()
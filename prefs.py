@@ -78,6 +78,24 @@ class BoneWidget_preferences(AddonPreferences):
         default=True,
     )
 
+    lazy_previews: BoolProperty(
+        name="Load Thumbnails on Demand",
+        description="Load the thumbnail previews when the panel is first drawn instead of when Blender starts",
+        default=True,
+    )
+
+    use_thumbnail_variants: BoolProperty(
+        name="Downscaled Thumbnails",
+        description="Load cached 128/256 px copies of the thumbnails when they are big enough for the preview sizes",
+        default=True,
+    )
+
+    use_thumbnail_atlas: BoolProperty(
+        name="Thumbnail Atlas",
+        description="Load the downscaled thumbnails from packed atlas pages (build them with Rebuild Thumbnail Atlas)",
+        default=False,
+    )
+
     edit_bone_colors: EnumProperty(
         name="Edit Bone Colors",
         description="Behavior of Edit Bone colors",
@@ -162,6 +180,19 @@ class BoneWidget_preferences(AddonPreferences):
         box_row.prop(self, "preview_default",
                      text="Display Previews by Default")
 
+        box_row = box.row()
+        box_row.prop(self, "lazy_previews",
+                     text="Load Thumbnails on Demand")
+
+        box_row = box.row()
+        box_row.prop(self, "use_thumbnail_variants",
+                     text="Use Downscaled Thumbnails")
+        box_row = box.row()
+        box_row.prop(self, "use_thumbnail_atlas", text="Use Thumbnail Atlas")
+        box_row.operator("bonewidget.build_thumbnail_atlas",
+                         icon="FILE_REFRESH", text="Rebuild Thumbnail Atlas")
+        box_row.enabled = self.use_thumbnail_variants
+
         box_row = box.row()
         box_col = box_row.column()
         box_col.label(text="Preview Panel Size:")